@@ -1,21 +1,24 @@
 import asyncio
 import io
 import os
-from typing import Optional
+import tempfile
+import time
+from typing import Literal, Optional
 
 import discord
+from discord import app_commands
 from discord.ext import commands
 from discord.ui import Button, View, Select
 
 from table2ascii import table2ascii as t2a, PresetStyle
 
-from app_server.backend.players import Player
+from app_server.backend.store import AsyncPlayerStore
+from app_server.backend.players import OPPONENT
+from app_server.backend.leagues import LeagueRegistry
+from app_server import renderer
+from app_server.render_cache import RenderCache
+from app_server.backend import metrics
 
-import pandas as pd
-import matplotlib
-import matplotlib.pyplot as plt
-from plottable import ColumnDefinition, Table
-from plottable.cmap import normed_cmap
 import logging
 from dotenv import load_dotenv
 
@@ -49,7 +52,123 @@ intents = discord.Intents.default()
 intents.message_content = True  # Required to read message content
 
 client = commands.Bot(command_prefix='!', intents=intents)
-players = Player()
+leagues = LeagueRegistry()
+render_cache = RenderCache()
+
+
+@client.check
+async def guild_only(ctx) -> bool:
+    """
+    Every league lives in a server, so commands can't be used in direct messages
+    """
+    if ctx.guild is None:
+        raise commands.NoPrivateMessage("Commands can only be used in a server")
+    return True
+
+
+@client.event
+async def on_command_error(ctx, error):
+    if isinstance(error, commands.NoPrivateMessage):
+        await ctx.send(str(error))
+        return
+    logger.error(f"Error in command {ctx.command}: {error}", exc_info=error)
+
+
+def league(ctx) -> AsyncPlayerStore:
+    """
+    The store for the league of the server the command was used in
+    """
+    return leagues.get(ctx.guild.id)
+
+
+DISCORD_MESSAGE_LIMIT = 2000
+SELECT_OPTION_LIMIT = 25  # Discord caps Select menus and autocomplete at 25 choices
+ROSTER_SELECT_MENUS = 4  # a message holds 5 component rows, the last one is RosterSelectView's Done button
+
+
+async def player_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[int]]:
+    """
+    Suggests players whose first, last or full name starts with what has been typed so far
+    """
+    if interaction.guild_id is None:
+        return []
+    players = leagues.get(interaction.guild_id)
+    matches = await players.search_players(current, SELECT_OPTION_LIMIT)
+    return [app_commands.Choice(name=f"{p['first_name']} {p['last_name'] or ''}".strip()[:100], value=p['player_id'])
+            for p in matches]
+
+
+async def select_player(ctx, player_list: list[dict], prompt: str) -> Optional[int]:
+    """
+    Asks for one player with a Select menu, rosters too big for a menu are pointed at the command's player option
+    :return: the selected player_id, None if the roster is too big
+    """
+    if len(player_list) > SELECT_OPTION_LIMIT:
+        await ctx.send("Too many players for a menu, fill in the command's player options (they autocomplete)")
+        return None
+    view = PlayerSelectView(sorted(player_list, key=lambda x: x['first_name']), 1)
+    await ctx.send(prompt, view=view)
+    await view.wait()
+    return int(view.value[0])
+
+
+def text_tables(header: list, body: list[list]) -> list[str]:
+    """
+    Renders rows as table2ascii code blocks, split so each block fits in one Discord message
+    """
+    if not body:
+        return []
+    # columns are as wide as their longest cell, so size blocks from a row made of every column's longest cell
+    widest = [max((str(row[c]) for row in body), key=len) for c in range(len(header))]
+    row_width = len(t2a(header=header, body=[widest], first_col_heading=True).splitlines()[-2]) + 1
+    rows_per_block = max(1, (DISCORD_MESSAGE_LIMIT - 10) // row_width - 5)
+
+    blocks = []
+    start = 0
+    while start < len(body):
+        count = rows_per_block
+        while True:
+            block = f"```\n{t2a(header=header, body=body[start:start + count], first_col_heading=True)}\n```"
+            if len(block) <= DISCORD_MESSAGE_LIMIT or count == 1:
+                break
+            count -= 1
+        blocks.append(block)
+        start += count
+    return blocks
+
+
+def match_history_text(matches: list[dict], player_name: str) -> tuple[str, int]:
+    """
+    Match history as a table2ascii code block, leaving off the oldest rows if it won't fit in one message
+    :return: the message text and how many of the matches it shows
+    """
+    while True:
+        table = t2a(
+            header=["Match", "Date", "Result", "Partner", "Opponent", "Score", "Opponent Score"],
+            body=[[m['match_id'], m['date'], m['result'], m['partner'], m['opponent'], m['score'], m['opponent_score']]
+                  for m in matches],
+            first_col_heading=True
+        )
+        text = f"**{player_name} Match History**\n```\n{table}\n```"
+        if len(text) <= DISCORD_MESSAGE_LIMIT or len(matches) == 1:
+            return text, len(matches)
+        matches = matches[:-1]
+
+
+SLOW_COMMAND_MS = 5000
+
+
+@client.before_invoke
+async def start_command_timer(ctx):
+    ctx.command_started = time.perf_counter()
+
+
+@client.after_invoke
+async def record_command_timer(ctx):
+    elapsed = (time.perf_counter() - ctx.command_started) * 1000
+    metrics.observe(metrics.COMMAND_HISTOGRAM, elapsed, command=ctx.command.qualified_name)
+    log = logger.warning if elapsed > SLOW_COMMAND_MS else logger.debug
+    log(f"Command {ctx.command.qualified_name} took {elapsed:.0f}ms")
 
 
 class Confirm(discord.ui.View):
@@ -75,7 +194,7 @@ class Confirm(discord.ui.View):
 
 
 class PlayerSelectView(View):
-    def __init__(self, player_list: list[dict], quantity: int = None):
+    def __init__(self, player_list: list[dict], quantity: int = None, min_values: int = None, max_values: int = None):
         super().__init__()
         self.value = None
         self.player_list = player_list
@@ -83,15 +202,14 @@ class PlayerSelectView(View):
         # Create the Select component dynamically
         options = []
         for p in self.player_list:
-            player_label = f"{p['first_name']} {p['last_name'][0].upper()}." if p['last_name'] else p['first_name']
-            options.append(discord.SelectOption(label=player_label,
+            options.append(discord.SelectOption(label=p['display_name'],
                                                 value=p['player_id']))  # Assuming 'id' as a unique value
 
         select = Select(
             placeholder="Choose an option",
             options=options,
-            min_values=quantity if quantity is not None else 1,
-            max_values=quantity if quantity is not None else 2,
+            min_values=min_values or (quantity if quantity is not None else 1),
+            max_values=max_values or (quantity if quantity is not None else 2),
             custom_id="player_select"  # It's good practice to add a custom_id
         )
         self.add_item(select)
@@ -104,12 +222,47 @@ class PlayerSelectView(View):
         self.value = selected_values  # Assign the list of selected values
 
 
-        selected_names = [
-            f"{p['first_name']} {p['last_name'][0].upper()}."
-            if p.get('last_name') else p['first_name']
-            for p in self.player_list if str(p.get('player_id')) in selected_values
-        ]
+        selected_names = [p['display_name'] for p in self.player_list if str(p.get('player_id')) in selected_values]
+
+        await interaction.response.send_message(f"You selected: {', '.join(selected_names)}")
+        self.stop()
+
+
+class RosterSelectView(View):
+    """
+    Multi-select over a roster larger than one Select menu, split alphabetically across up to
+    ROSTER_SELECT_MENUS menus with a Done button. value is every player picked across the menus.
+    """
+
+    def __init__(self, player_list: list[dict]):
+        super().__init__()
+        self.value = None
+        self.player_list = player_list
+        self.selected: dict[str, list[str]] = {}
+
+        for i in range(0, len(player_list), SELECT_OPTION_LIMIT):
+            chunk = player_list[i:i + SELECT_OPTION_LIMIT]
+            select = Select(
+                placeholder=f"{chunk[0]['display_name']} - {chunk[-1]['display_name']}"[:150],
+                options=[discord.SelectOption(label=p['display_name'], value=p['player_id']) for p in chunk],
+                min_values=0,
+                max_values=len(chunk),
+                custom_id=f"roster_select_{i // SELECT_OPTION_LIMIT}"
+            )
+            select.callback = self.select_callback
+            self.add_item(select)
+
+        done = Button(label='Done', style=discord.ButtonStyle.green)
+        done.callback = self.done_callback
+        self.add_item(done)
+
+    async def select_callback(self, interaction: discord.Interaction):
+        self.selected[interaction.data['custom_id']] = interaction.data['values']
+        await interaction.response.defer()
 
+    async def done_callback(self, interaction: discord.Interaction):
+        self.value = [player_id for values in self.selected.values() for player_id in values]
+        selected_names = [p['display_name'] for p in self.player_list if str(p['player_id']) in self.value]
         await interaction.response.send_message(f"You selected: {', '.join(selected_names)}")
         self.stop()
 
@@ -139,6 +292,80 @@ class ScoreSelectView(View):
         self.stop()
 
 
+class MatchHistoryView(View):
+    """
+    Prev/Next paging over a player's match history, each page is fetched and rendered only when requested
+    """
+
+    def __init__(self, players: AsyncPlayerStore, player_id: int, opp_id: int, count: int, player_name: str,
+                 mode: str = 'image'):
+        super().__init__()
+        self.players = players
+        self.mode = mode
+        self.player_id = player_id
+        self.opp_id = opp_id
+        self.count = count
+        self.player_name = player_name
+        self.cursors = [None]  # keyset cursor for the start of each page visited so far
+        self.page = 0
+        self.has_next = False
+
+    async def load_page(self, page: int) -> Optional[bytes | str]:
+        """
+        :return: PNG bytes in image mode, message text in text mode, None if the page has no matches
+        """
+        with metrics.stage('playerhistory', 'query'):
+            matches, next_cursor = await self.players.get_player_matches_page(self.count, self.player_id,
+                                                                              self.opp_id, self.cursors[page])
+        if not matches:
+            return None
+
+        text = None
+        if self.mode == 'text':
+            text, shown = match_history_text(matches, self.player_name)
+            if shown < len(matches):
+                # rows that didn't fit start the next page rather than being skipped
+                next_cursor = (matches[shown - 1]['date'], matches[shown - 1]['match_id'])
+
+        self.page = page
+        self.has_next = next_cursor is not None
+        if self.has_next and len(self.cursors) == page + 1:
+            self.cursors.append(next_cursor)
+        self.prev_page.disabled = page == 0
+        self.next_page.disabled = not self.has_next
+
+        if text is not None:
+            return text
+
+        cache_key = ('history', self.players.database, self.player_id, self.opp_id, self.count, self.cursors[page],
+                     self.players.data_version)
+        image = render_cache.get(cache_key)
+        if image is None:
+            image = await renderer.match_history_image(matches, self.player_name)
+            render_cache.put(cache_key, image)
+        return image
+
+    async def _show_page(self, interaction: discord.Interaction, page: int):
+        await interaction.response.defer()
+        image = await self.load_page(page)
+        if image is None:
+            await interaction.followup.send('No more matches', ephemeral=True)
+            return
+        if self.mode == 'text':
+            await interaction.edit_original_response(content=image, view=self)
+            return
+        await interaction.edit_original_response(attachments=[discord.File(io.BytesIO(image), filename="rankings.png")],
+                                                 view=self)
+
+    @discord.ui.button(label='Prev', style=discord.ButtonStyle.grey)
+    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show_page(interaction, max(self.page - 1, 0))
+
+    @discord.ui.button(label='Next', style=discord.ButtonStyle.grey)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show_page(interaction, self.page + 1)
+
+
 @client.command()
 @commands.is_owner()
 async def sync(ctx: commands.Context):
@@ -147,106 +374,169 @@ async def sync(ctx: commands.Context):
     await ctx.send(f"Synced {len(synced)} commands.")
 
 
+@client.hybrid_command(name='replayratings')
+@commands.is_owner()
+async def replay_ratings(ctx):
+    players = league(ctx)
+    summary = await players.replay_ratings()
+    await ctx.send(f"Replayed {summary['matches']} matches, {summary['changed']} of {summary['players']} "
+                   f"ratings changed ({summary['seconds']:.2f}s)")
+
+
+@client.hybrid_command(name='importmatches')
+@commands.is_owner()
+async def import_matches(ctx, attachment: discord.Attachment, create_missing: Optional[bool] = False):
+    players = league(ctx)
+    suffix = '.jsonl' if attachment.filename.endswith(('.jsonl', '.json')) else '.csv'
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, f"import{suffix}")
+        await attachment.save(path)
+        summary = await players.import_matches(path, create_missing)
+    await ctx.send(f"Imported {summary['imported']} matches ({summary['skipped']} skipped, "
+                   f"{summary['created_players']} players created) in {summary['seconds']:.2f}s")
+
+
+@client.hybrid_command(name='perf')
+@commands.is_owner()
+async def perf(ctx, export: Optional[bool] = False):
+    rows = sorted(metrics.snapshot(), key=lambda h: (h['name'], sorted(h['labels'].items())))
+    body = [[h['name'].removesuffix('_ms'), ' '.join(str(v) for _, v in sorted(h['labels'].items())), h['count'],
+             f"{h['mean_ms']:.1f}", f"{h['p50_ms']:g}", f"{h['p95_ms']:g}"] for h in rows]
+    blocks = text_tables(["Metric", "Labels", "Count", "Mean ms", "p50 ms", "p95 ms"], body)
+    for block in blocks or ['No measurements yet']:
+        await ctx.send(block)
+
+    cache = render_cache.stats()
+    await ctx.send(f"Render cache: {cache['entries']} entries, {cache['bytes'] / 1024 / 1024:.1f} MB, "
+                   f"{cache['hits']} hits / {cache['misses']} misses ({cache['hit_rate'] * 100:.0f}%)")
+
+    if export:
+        metrics_file = os.getenv('METRICS_FILE')
+        if metrics_file:
+            metrics.write_prometheus(metrics_file)
+        await ctx.send(file=discord.File(io.BytesIO(metrics.export_prometheus().encode()), filename="metrics.prom"))
+
+
 @client.hybrid_command(name='listrank')
-async def list_rank(ctx):
-    player_list = players.get_all_current_ranking()
-
-    if player_list:
-        output = t2a(
-            header=["Rank", "Name", "Games Played", "Wins", "Losses", "Win %"],
-            body=[[player['rank'], player['name'], player['games'], player['wins'], player['losses'], player['percent']] for
-                  player in player_list],
-            first_col_heading=True
-        )
+async def list_rank(ctx, mode: Optional[Literal['image', 'text']] = 'image'):
+    players = league(ctx)
+    if mode == 'text':
+        with metrics.stage('listrank', 'query'):
+            player_list = await players.get_all_current_ranking()
+        if not player_list:
+            await ctx.send("No players available")
+            return
+
+        for block in text_tables(["Rank", "Name", "Games Played", "Wins", "Losses", "Win %"],
+                                 [[player['rank'], player['name'], player['games'], player['wins'], player['losses'],
+                                   f"{player['percent']:.2f}"] for player in player_list]):
+            await ctx.send(block)
+        return
 
-        user_id = ctx.author.id
-        logger.debug(f"Your user ID is: {user_id}")
-
-        bg_color = "#FFFFFF"
-        text_color = "#000000"
-
-        df = pd.DataFrame(player_list)
-        new_order = ['rank', 'name', 'games', 'wins', 'losses', 'percent']
-        df_reorderd = df[new_order]
-
-        df['percent'] = df['percent'].map('{:,.2f}'.format).astype(str)
-        df_reorderd.update(df[['percent']].astype(float))
-
-        col_defs = [
-            ColumnDefinition(name="rank",
-                             title="Rank",
-                             textprops={"ha": "left", "weight": "bold"},
-                             group="Player", ),
-            ColumnDefinition(name="name",
-                             title="Name",
-                             textprops={"ha": "left"},
-                             group="Player"),
-            ColumnDefinition(name="games",
-                             title="Games Played",
-                             textprops={"ha": "center"},
-                             group="Stats"),
-            ColumnDefinition(name="wins",
-                             title="Wins",
-                             textprops={"ha": "center"},
-                             group="Stats"),
-            ColumnDefinition(name="losses",
-                             title="Losses",
-                             textprops={"ha": "center"},
-                             group="Stats"),
-            ColumnDefinition(name="percent",
-                             title="Win %",
-                             textprops={"ha": "center", "color": text_color, "weight": "bold"},
-                             group="Stats",
-                             cmap=normed_cmap(df_reorderd['percent'], cmap=matplotlib.colormaps['RdYlGn'], num_stds=2))
-        ]
-
-        height = max(len(player_list) - 3, 4)
-
-        fig, ax = plt.subplots(figsize=(10, height))
-        ax.axis('off')  # Hide axes
-        fig.set_facecolor(bg_color)
-        ax.set_facecolor(bg_color)
-        table = Table(
-            df_reorderd,
-            column_definitions=col_defs,
-            index_col="rank",
-            row_dividers=True,
-            footer_divider=True,
-            textprops={'fontsize': 14},
-            ax=ax
+    cache_key = ('rankings', players.database, players.data_version)
+    image = render_cache.get(cache_key)
 
-        )
+    if image is None:
+        with metrics.stage('listrank', 'query'):
+            player_list = await players.get_all_current_ranking()
+        if not player_list:
+            await ctx.send("No players available")
+            return
 
-        buffer = io.BytesIO()
-        fig.savefig(
-            buffer,
-            format='png',
-            dpi=200,
-            bbox_inches="tight"
-        )
-        buffer.seek(0)
-
-        plt.close(fig)
-        try:
-            await ctx.send(file=discord.File(buffer, filename="rankings.png"))
-            await ctx.send("Current rankings!")
-        except Exception as e:
-            await ctx.send(f"An error occurred while sending the plot: {e}")
-            logger.error(f"Error sending plot: {e}")
-    else:
-        await ctx.send("No players available")
+        image = await renderer.rankings_image(player_list)
+        render_cache.put(cache_key, image)
+
+    user_id = ctx.author.id
+    logger.debug(f"Your user ID is: {user_id}")
+
+    try:
+        with metrics.stage('listrank', 'send'):
+            await ctx.send(file=discord.File(io.BytesIO(image), filename="rankings.png"))
+        await ctx.send("Current rankings!")
+    except Exception as e:
+        await ctx.send(f"An error occurred while sending the plot: {e}")
+        logger.error(f"Error sending plot: {e}")
 
 
 @client.hybrid_command(name='addplayer')
 async def add_player(ctx, first_name: str, last_name: str):
-    created = players.create_new_player(first_name, last_name)
+    players = league(ctx)
+    created = await players.create_new_player(first_name, last_name)
     await ctx.send(f"Added {first_name} {last_name[0].upper()}" if created else 'Error adding player')
 
 
+def match_entry_error(team_1: list[str], team_2: list[str], directory: dict[int, dict],
+                      team_1_score: Optional[int] = None, team_2_score: Optional[int] = None) -> Optional[str]:
+    """
+    Checks a match entered through command options before anything is recorded
+    :return: message explaining the problem, None if the match is valid
+    """
+    if len(team_1) != len(team_2):
+        return "Both teams need the same number of players"
+    if len(set(team_1 + team_2)) != len(team_1 + team_2) or any(int(p) not in directory for p in team_1 + team_2):
+        return "Pick different, existing players for each spot"
+    for score in (team_1_score, team_2_score):
+        if score is not None and score < 0:
+            return "Scores can't be negative"
+    if team_1_score is not None and team_1_score == team_2_score:
+        return "Scores can't be tied, one team has to win"
+    return None
+
+
 @client.hybrid_command(name='savematch')
-async def save_match(ctx) -> list:
-    player_list = players.retrieve_player_list()
+@app_commands.autocomplete(player=player_autocomplete, partner=player_autocomplete,
+                           opponent=player_autocomplete, opponent_partner=player_autocomplete)
+@app_commands.describe(player='You, or the first player on team 1', partner='Team 1 partner, leave empty for singles',
+                       opponent='First player on team 2', opponent_partner='Team 2 partner, leave empty for singles',
+                       score='Team 1 score', opponent_score='Team 2 score')
+async def save_match(ctx, player: Optional[int] = None, partner: Optional[int] = None,
+                     opponent: Optional[int] = None, opponent_partner: Optional[int] = None,
+                     score: Optional[int] = None, opponent_score: Optional[int] = None) -> list:
+    players = league(ctx)
+    player_list = await players.retrieve_player_list()
     player_list = sorted(player_list, key=lambda x: x['first_name'])
+    directory = {p['player_id']: p for p in player_list}
+
+    if player is not None and opponent is not None:
+        # players picked with autocomplete, with both scores filled in this is a single request and reply
+        team_1 = [str(p) for p in (player, partner) if p is not None]
+        team_2 = [str(p) for p in (opponent, opponent_partner) if p is not None]
+        error = match_entry_error(team_1, team_2, directory, score, opponent_score)
+        if error:
+            await ctx.send(error)
+            return
+
+        # otherwise fall back to selecting whichever scores are missing
+        if score is None:
+            score_1_view = ScoreSelectView()
+            await ctx.send("Select team 1 score:", view=score_1_view)
+            await score_1_view.wait()
+            score = int(score_1_view.value)
+
+        if opponent_score is None:
+            score_2_view = ScoreSelectView()
+            await ctx.send("Select team 2 score:", view=score_2_view)
+            await score_2_view.wait()
+            opponent_score = int(score_2_view.value)
+
+        if score == opponent_score:
+            await ctx.send("Scores can't be tied, one team has to win")
+            return
+
+        result = await players.add_match(team_1, team_2, score, opponent_score)
+        if not result:
+            await ctx.send('Error adding match...')
+            return
+        changes = ', '.join(f"{directory[player_id]['display_name']} {change['delta']:+d}"
+                            for player_id, change in result['ratings'].items())
+        await ctx.send(f"Match successfully added: {' & '.join(directory[int(p)]['display_name'] for p in team_1)} "
+                       f"{score} - {opponent_score} {' & '.join(directory[int(p)]['display_name'] for p in team_2)} "
+                       f"({changes})")
+        return
+
+    if len(player_list) > SELECT_OPTION_LIMIT:
+        await ctx.send("Too many players for a menu, fill in the player and opponent options (they autocomplete)")
+        return
 
     # Select team 1 players
     view_1 = PlayerSelectView(player_list)
@@ -272,7 +562,7 @@ async def save_match(ctx) -> list:
         return
     elif len(filtered_players) == 1:
         confirm_view = Confirm()
-        await ctx.send(f"Is team 2 {filtered_players[0]['first_name']} {filtered_players[0]['last_name'][0].upper()}.?",
+        await ctx.send(f"Is team 2 {filtered_players[0]['display_name']}?",
                        view=confirm_view)
         await confirm_view.wait()
         team_2 = [str(filtered_players[0]['player_id'])]
@@ -289,113 +579,354 @@ async def save_match(ctx) -> list:
     await score_2_view.wait()
     team_2_score = int(score_2_view.value)
 
-    await ctx.send('Match successfully added' if players.add_match(team_1, team_2, team_1_score,
-                                                                   team_2_score) else 'Error adding match...')
+    await ctx.send('Match successfully added' if await players.add_match(team_1, team_2, team_1_score,
+                                                                         team_2_score) else 'Error adding match...')
+@client.hybrid_command(name='editmatch')
+@commands.is_owner()
+@app_commands.autocomplete(player=player_autocomplete, partner=player_autocomplete,
+                           opponent=player_autocomplete, opponent_partner=player_autocomplete)
+@app_commands.describe(match_id='Match number, shown in /playerhistory text mode')
+async def edit_match(ctx, match_id: int, player: int, opponent: int, score: int, opponent_score: int,
+                     partner: Optional[int] = None, opponent_partner: Optional[int] = None):
+    players = league(ctx)
+    directory = {p['player_id']: p for p in await players.retrieve_player_list()}
+    team_1 = [str(p) for p in (player, partner) if p is not None]
+    team_2 = [str(p) for p in (opponent, opponent_partner) if p is not None]
+    error = match_entry_error(team_1, team_2, directory, score, opponent_score)
+    if error:
+        await ctx.send(error)
+        return
+
+    summary = await players.edit_match(match_id, team_1, team_2, score, opponent_score)
+    if summary is None:
+        await ctx.send(f"No match {match_id}")
+        return
+    await ctx.send(f"Match {match_id} updated: {' & '.join(directory[int(p)]['display_name'] for p in team_1)} "
+                   f"{score} - {opponent_score} {' & '.join(directory[int(p)]['display_name'] for p in team_2)}, "
+                   f"re-rated {summary['matches']} matches ({summary['changed']} ratings changed)")
+
+
+@client.hybrid_command(name='deletematch')
+@commands.is_owner()
+async def delete_match(ctx, match_id: int):
+    players = league(ctx)
+    confirm_view = Confirm()
+    await ctx.send(f"Delete match {match_id}?", view=confirm_view)
+    await confirm_view.wait()
+    if not confirm_view.value:
+        return
+
+    summary = await players.delete_match(match_id)
+    if summary is None:
+        await ctx.send(f"No match {match_id}")
+        return
+    await ctx.send(f"Match {match_id} deleted, re-rated {summary['matches']} matches "
+                   f"({summary['changed']} ratings changed)")
+
+
 @client.hybrid_command(name='playerhistory')
-async def list_matches(ctx, count:Optional[int] = 10):
-    player_list = players.retrieve_player_list()
+@app_commands.autocomplete(player=player_autocomplete, opponent=player_autocomplete)
+async def list_matches(ctx, count:Optional[int] = 10, mode: Optional[Literal['image', 'text']] = 'image',
+                       player: Optional[int] = None, opponent: Optional[int] = None):
+    if count < 1:
+        await ctx.send('Count must be at least 1')
+        return
+
+    players = league(ctx)
+    player_list = await players.retrieve_player_list()
     if not player_list:
         await ctx.send('No players available')
+        return
 
     player_list = sorted(player_list, key=lambda x: x['first_name'])
+    directory = {p['player_id']: p for p in player_list}
+
+    if player is not None:
+        # picked with autocomplete, no opponent means all matches
+        if player not in directory or (opponent is not None and opponent not in directory):
+            await ctx.send('Unknown player')
+            return
+        team_1 = [str(player)]
+        team_2 = [str(opponent if opponent is not None else -1)]
+        player_name = directory[player]['display_name']
+    elif len(player_list) > SELECT_OPTION_LIMIT:
+        await ctx.send("Too many players for a menu, fill in the player option (it autocompletes)")
+        return
+    else:
+        # Select player
+        view_1 = PlayerSelectView(player_list, 1)
+        await ctx.send("Select player for match history:", view=view_1)
+        await view_1.wait()
+        team_1 = view_1.value
+
+        # remove team 1 players from choices
+        filtered_players = []
+        player_name = None
+        for p in player_list:
+            if str(p['player_id']) not in team_1:
+                filtered_players.append(p)
+            else:
+                player_name = p['display_name']
+
+        filtered_players.insert(0, {'player_id': -1, 'first_name':'ALL', 'last_name':None, 'display_name': 'ALL'})
+
+        view_2 = PlayerSelectView(filtered_players[:SELECT_OPTION_LIMIT], 1)
+        await ctx.send(f"Select match opponent or 'ALL'", view=view_2)
+        await view_2.wait()
+        team_2 = view_2.value
 
-    # Select player
-    view_1 = PlayerSelectView(player_list, 1)
-    await ctx.send("Select player for match history:", view=view_1)
-    await view_1.wait()
-    team_1 = view_1.value
+    history_view = MatchHistoryView(players, int(team_1[0]), int(team_2[0]), count, player_name, mode)
+    image = await history_view.load_page(0)
 
-    # remove team 1 players from choices
-    filtered_players = []
-    player_name = None
-    for p in player_list:
-        if str(p['player_id']) not in team_1:
-            filtered_players.append(p)
-        else:
-            player_name = f"{p['first_name']} {p['last_name'][0].upper()}." if p['last_name'] else p['first_name']
+    if image is None:
+        await ctx.send('No match history for selected player(s)')
+        return
 
-    filtered_players.insert(0, {'player_id': -1, 'first_name':'ALL', 'last_name':None})
+    if mode == 'text':
+        await ctx.send(image, view=history_view)
+        return
 
-    view_2 = PlayerSelectView(filtered_players, 1)
-    await ctx.send(f"Select match opponent or 'ALL'", view=view_2)
-    await view_2.wait()
-    team_2 = view_2.value
+    try:
+        with metrics.stage('playerhistory', 'send'):
+            await ctx.send(file=discord.File(io.BytesIO(image), filename="rankings.png"), view=history_view)
+        await ctx.send("Match History!")
+    except Exception as e:
+        await ctx.send(f"An error occurred while sending the plot: {e}")
+        logger.error(f"Error sending plot: {e}")
 
-    matches = players.get_player_matches(count, int(team_1[0]), int(team_2[0]))
 
-    if not matches:
-        await ctx.send('No match history for selected player(s)')
 
-    bg_color = "#FFFFFF"
-    text_color = "#000000"
-
-    df = pd.DataFrame(matches)
-    new_order = ['result', 'partner', 'opponent', 'score', 'opponent_score', 'date']
-    df_reordered = df[new_order]
-
-    col_defs = [
-        ColumnDefinition(name="date",
-                         title="Date",
-                         textprops={"ha": "left"}),
-        ColumnDefinition(name="result",
-                         title="Result",
-                         textprops={"ha": "left", "weight": "bold"}),
-        ColumnDefinition(name="partner",
-                         title="Partner",
-                         textprops={"ha": "left"},
-                         group='Players'),
-        ColumnDefinition(name="opponent",
-                         title="Opponent",
-                         textprops={"ha": "left"},
-                         group='Players'),
-        ColumnDefinition(name="score",
-                         title="Score",
-                         textprops={"ha": "center"},
-                         group="Score"),
-        ColumnDefinition(name="opponent_score",
-                         title="Opponent Score",
-                         textprops={"ha": "center"},
-                         group="Score"),
-        ]
-    height = max(len(player_list) - 3, 4)
-
-    plt.title("Sports Watch Data")
-
-    fig, ax = plt.subplots(figsize=(20, height))
-    ax.axis('off')  # Hide axes
-    fig.set_facecolor(bg_color)
-    ax.set_facecolor(bg_color)
-
-    fig.suptitle(f"{player_name} Match History", fontsize=24, fontweight='bold', color='black')
-
-    table = Table(
-        df_reordered,
-        column_definitions=col_defs,
-        index_col="date",
-        row_dividers=True,
-        footer_divider=True,
-        textprops={'fontsize': 14},
-        ax=ax
-    )
-
-    buffer = io.BytesIO()
-    fig.savefig(
-        buffer,
-        format='png',
-        dpi=200,
-        bbox_inches="tight"
-    )
-    buffer.seek(0)
-
-    plt.close(fig)
+
+@client.hybrid_command(name='ratingchart')
+@app_commands.autocomplete(player=player_autocomplete)
+async def rating_chart(ctx, player: Optional[int] = None):
+    players = league(ctx)
+    player_list = await players.retrieve_player_list()
+    if not player_list:
+        await ctx.send('No players available')
+        return
+
+    directory = {p['player_id']: p for p in player_list}
+    player_id = player if player is not None else await select_player(ctx, player_list, "Select player for rating chart:")
+    if player_id is None:
+        return
+    if player_id not in directory:
+        await ctx.send('Unknown player')
+        return
+    player_name = directory[player_id]['display_name']
+
+    cache_key = ('ratingchart', players.database, player_id, players.data_version)
+    image = render_cache.get(cache_key)
+
+    if image is None:
+        points = await players.get_rating_history(player_id)
+        if not points:
+            await ctx.send('No rating history for selected player')
+            return
+
+        image = await renderer.rating_chart_image(points, player_name)
+        render_cache.put(cache_key, image)
+
     try:
-        await ctx.send(file=discord.File(buffer, filename="rankings.png"))
-        await ctx.send("Match History!")
+        await ctx.send(file=discord.File(io.BytesIO(image), filename="rating_chart.png"))
     except Exception as e:
         await ctx.send(f"An error occurred while sending the plot: {e}")
         logger.error(f"Error sending plot: {e}")
 
 
+@client.hybrid_command(name='predict')
+@app_commands.autocomplete(player=player_autocomplete, partner=player_autocomplete,
+                           opponent=player_autocomplete, opponent_partner=player_autocomplete)
+@app_commands.describe(player='First player on team 1', partner='Team 1 partner, leave empty for singles',
+                       opponent='First player on team 2', opponent_partner='Team 2 partner, leave empty for singles')
+async def predict(ctx, player: Optional[int] = None, partner: Optional[int] = None,
+                  opponent: Optional[int] = None, opponent_partner: Optional[int] = None):
+    players = league(ctx)
+    player_list = await players.retrieve_player_list()
+    if len(player_list) < 2:
+        await ctx.send('Not enough players available')
+        return
+
+    player_list = sorted(player_list, key=lambda x: x['first_name'])
+    names = {str(p['player_id']): p['display_name'] for p in player_list}
+
+    if player is not None and opponent is not None:
+        team_1 = [str(p) for p in (player, partner) if p is not None]
+        team_2 = [str(p) for p in (opponent, opponent_partner) if p is not None]
+        error = match_entry_error(team_1, team_2, {p['player_id']: p for p in player_list})
+        if error:
+            await ctx.send(error)
+            return
+        await send_prediction(ctx, players, names, team_1, team_2)
+        return
+
+    if len(player_list) > SELECT_OPTION_LIMIT:
+        await ctx.send("Too many players for a menu, fill in the player and opponent options (they autocomplete)")
+        return
+
+    view_1 = PlayerSelectView(player_list)
+    await ctx.send("Select up to two players for team 1:", view=view_1)
+    await view_1.wait()
+    team_1 = view_1.value
+
+    filtered_players = [p for p in player_list if str(p['player_id']) not in team_1]
+    if len(filtered_players) < len(team_1):
+        await ctx.send("Not enough remaining players to add to team 2...")
+        return
+
+    view_2 = PlayerSelectView(filtered_players, len(team_1))
+    quantity = "one" if len(team_1) == 1 else "two"
+    await ctx.send(f"Select {quantity} player(s) for team 2:", view=view_2)
+    await view_2.wait()
+    team_2 = view_2.value
+
+    await send_prediction(ctx, players, names, team_1, team_2)
+
+
+async def send_prediction(ctx, players: AsyncPlayerStore, names: dict[str, str], team_1: list[str], team_2: list[str]):
+    """
+    Replies with each team's rating and chance to win
+    """
+    prediction = await players.predict_match(team_1, team_2)
+    await ctx.send(f"{' & '.join(names[p] for p in team_1)} ({prediction['team_1_rating']:.0f}): "
+                   f"{prediction['team_1_expected'] * 100:.1f}% to win\n"
+                   f"{' & '.join(names[p] for p in team_2)} ({prediction['team_2_rating']:.0f}): "
+                   f"{prediction['team_2_expected'] * 100:.1f}% to win")
+
+
+@client.hybrid_command(name='matchmake')
+async def matchmake(ctx, avoid_repeat_partners: Optional[bool] = True):
+    players = league(ctx)
+    player_list = await players.retrieve_player_list()
+    if len(player_list) < 4:
+        await ctx.send('Not enough players available')
+        return
+
+    names = {p['player_id']: p['display_name'] for p in player_list}
+    roster_limit = SELECT_OPTION_LIMIT * ROSTER_SELECT_MENUS
+    prompt = "Select the players present:"
+    if len(player_list) > roster_limit:
+        # only so many players fit in one message, offer the most recently active
+        player_list = await players.search_players('', roster_limit)
+        prompt = f"Select the players present (the {roster_limit} most recently active players are listed):"
+    player_list = sorted(player_list, key=lambda x: x['first_name'])
+
+    view = RosterSelectView(player_list)
+    await ctx.send(prompt, view=view)
+    await view.wait()
+    if view.value is None or len(view.value) < 4:
+        await ctx.send('Select at least 4 players')
+        return
+
+    result = await players.matchmake([int(p) for p in view.value], avoid_repeat_partners)
+
+    lines = []
+    for i, court in enumerate(result['courts']):
+        lines.append(f"Court {i + 1}: {' & '.join(names[p] for p in court['team_1'])} ({court['team_1_rating']:.0f}) vs "
+                     f"{' & '.join(names[p] for p in court['team_2'])} ({court['team_2_rating']:.0f})")
+    if result['sit_out']:
+        lines.append(f"Sitting out: {', '.join(names[p] for p in result['sit_out'])}")
+    await ctx.send('\n'.join(lines))
+
+
+@client.hybrid_command(name='myrank')
+@app_commands.autocomplete(player=player_autocomplete)
+@app_commands.describe(player='Which player you are, only needed the first time')
+async def my_rank(ctx, radius: Optional[int] = 2, player: Optional[int] = None):
+    players = league(ctx)
+    player_list = await players.retrieve_player_list()
+    directory = {p['player_id']: p for p in player_list}
+    linked = next((p for p in player_list if p['discord_id'] == ctx.author.id), None)
+
+    if linked is None:
+        # first use, link the caller's Discord account to their player so next time is a single lookup
+        unlinked = [p for p in player_list if p['discord_id'] is None]
+        if player is None and not unlinked:
+            await ctx.send('No unlinked players available')
+            return
+        player_id = player if player is not None else await select_player(ctx, unlinked, "Which player are you?")
+        if player_id is None:
+            return
+        if player_id not in directory:
+            await ctx.send('Unknown player')
+            return
+        if not await players.update_discord_id(player_id, ctx.author.id):
+            await ctx.send(f"{directory[player_id]['display_name']} is already linked to another Discord account")
+            return
+        linked = directory[player_id]
+    player = linked
+
+    rows = await players.get_rank_neighbourhood(player['player_id'], max(0, min(radius, 10)))
+    if not rows:
+        await ctx.send(f"{player['display_name']} is not ranked yet, play a match first!")
+        return
+
+    for block in text_tables(["Rank", "Name", "Rating", "Games Played", "Wins", "Losses"],
+                             [[f"> {r['rank']}" if r['player_id'] == player['player_id'] else r['rank'], r['name'],
+                               r['rating'], r['games'], r['wins'], r['losses']] for r in rows]):
+        await ctx.send(block)
+
+
+@client.hybrid_command(name='h2h')
+@app_commands.autocomplete(player=player_autocomplete, opponent=player_autocomplete)
+async def head_to_head(ctx, player: Optional[int] = None, opponent: Optional[int] = None):
+    players = league(ctx)
+    player_list = await players.retrieve_player_list()
+    if len(player_list) < 2:
+        await ctx.send('Not enough players available')
+        return
+
+    names = {p['player_id']: p['display_name'] for p in player_list}
+
+    player_id = player if player is not None else await select_player(ctx, player_list, "Select player:")
+    if player_id is None:
+        return
+    opp_id = opponent if opponent is not None else await select_player(
+        ctx, [p for p in player_list if p['player_id'] != player_id], "Select opponent:")
+    if opp_id is None:
+        return
+    if player_id not in names or opp_id not in names or player_id == opp_id:
+        await ctx.send('Pick two different, existing players')
+        return
+
+    record = await players.get_pair_record(player_id, opp_id, OPPONENT)
+    if not record['games']:
+        await ctx.send(f"{names[player_id]} and {names[opp_id]} haven't played each other yet")
+        return
+
+    await ctx.send(f"{names[player_id]} vs {names[opp_id]}: {record['wins']}-{record['losses']} "
+                   f"({record['percent']:.1f}%) over {record['games']} games, "
+                   f"points {record['points_for']}-{record['points_against']}")
+
+
+@client.hybrid_command(name='partners')
+@app_commands.autocomplete(player=player_autocomplete)
+async def partners(ctx, mode: Optional[Literal['partner', 'opponent']] = 'partner', player: Optional[int] = None):
+    players = league(ctx)
+    player_list = await players.retrieve_player_list()
+    if not player_list:
+        await ctx.send('No players available')
+        return
+
+    names = {p['player_id']: p['display_name'] for p in player_list}
+
+    player_id = player if player is not None else await select_player(ctx, player_list, "Select player:")
+    if player_id is None:
+        return
+    if player_id not in names:
+        await ctx.send('Unknown player')
+        return
+
+    records = await players.get_pair_records(player_id, mode)
+    if not records:
+        await ctx.send(f"No {mode} records for {names[player_id]}")
+        return
+
+    await ctx.send(f"**{names[player_id]} by {mode}**")
+    for block in text_tables([mode.title(), "Games", "Wins", "Losses", "Win %", "Points For", "Points Against"],
+                             [[names.get(r['player_id'], r['player_id']), r['games'], r['wins'], r['losses'],
+                               f"{r['percent']:.2f}", r['points_for'], r['points_against']] for r in records]):
+        await ctx.send(block)
 
 
 @client.hybrid_command()
@@ -428,10 +959,16 @@ if __name__ == '__main__':
     print('starting discord server')
     token=os.getenv('DISCORD_TOKEN')
     print(token)
-    client.run(
-        token=os.getenv('DISCORD_TOKEN'),
-        log_level=logging.DEBUG,
-        log_handler=console_handler if deployment_env == 'development' else file_handler,
-        log_formatter=formatter,
-        reconnect=True
-    )
+    try:
+        leagues.check_legacy_database()
+        client.run(
+            token=os.getenv('DISCORD_TOKEN'),
+            log_level=logging.DEBUG,
+            log_handler=console_handler if deployment_env == 'development' else file_handler,
+            log_formatter=formatter,
+            reconnect=True
+        )
+    finally:
+        # run() returns once the bot has closed, let in-flight writes finish then release connections and workers
+        leagues.close()
+        renderer.shutdown()
@@ -0,0 +1,45 @@
+import sqlite3
+from contextlib import contextmanager
+from typing import Iterator
+
+from app_server.backend.metrics import InstrumentedConnection
+
+# prepared statements kept per connection, sized so every query the bot runs stays compiled
+# (the sqlite3 default of 128 gets churned by the dynamic IN (...) and paging queries)
+STATEMENT_CACHE_SIZE = 512
+
+# WAL lets readers keep going while a match is being written, NORMAL sync is still durable in WAL mode
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+
+def connect(database: str) -> sqlite3.Connection:
+    """
+    Opens and configures a connection, meant to be opened once per worker thread and reused.
+    check_same_thread is off only so the pool can close connections at shutdown once its workers have stopped,
+    a connection is never used by more than one thread at a time.
+    """
+    conn = sqlite3.connect(database, factory=InstrumentedConnection, cached_statements=STATEMENT_CACHE_SIZE,
+                           check_same_thread=False)
+    with cursor(conn) as cur:
+        for pragma in PRAGMAS:
+            cur.execute(pragma)
+    return conn
+
+
+@contextmanager
+def cursor(conn: sqlite3.Connection) -> Iterator[sqlite3.Cursor]:
+    """
+    Cursor that is closed when the block exits, even if a statement raises
+    """
+    cur = conn.cursor()
+    try:
+        yield cur
+    finally:
+        cur.close()
@@ -0,0 +1,33 @@
+import numpy as np
+
+DEFAULT_MAX_POINTS = 500
+
+
+def lttb(xs: list[float], ys: list[float], threshold: int) -> list[int]:
+    """
+    Largest-Triangle-Three-Buckets downsampling, keeps the points that best preserve the visual shape of a line
+    :return: indexes of the points to keep, always including the first and last
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    x = np.asarray(xs, dtype=np.float64)
+    y = np.asarray(ys, dtype=np.float64)
+    bucket_size = (n - 2) / (threshold - 2)
+
+    keep = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_start = end
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(areas.argmax())
+        keep.append(a)
+    keep.append(n - 1)
+    return keep
@@ -0,0 +1,148 @@
+import argparse
+import csv
+import json
+import logging
+import sqlite3
+import time
+from datetime import datetime
+from itertools import islice
+from typing import Iterator, Optional
+
+from app_server.backend import connections as Connections
+
+logger = logging.getLogger('bot_logger')
+
+BATCH_SIZE = 1000
+BATCHES_PER_TRANSACTION = 50
+
+PLAYER_COLUMNS = ('team_1_player_1', 'team_1_player_2', 'team_2_player_1', 'team_2_player_2')
+
+
+def read_rows(path: str) -> Iterator[dict | str]:
+    """
+    Streams match rows from a .csv (with a header row) or .jsonl file. Expected keys are
+    team_1_player_1, team_1_player_2, team_2_player_1, team_2_player_2 (player names, partners blank for singles),
+    team_1_score, team_2_score and an optional game_ts.
+    JSONL lines are yielded unparsed so a malformed line is skipped by match_tuples like any other bad row.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.jsonl') or path.endswith('.json'):
+            for line in f:
+                if line.strip():
+                    yield line
+        else:
+            yield from csv.DictReader(f)
+
+
+class NameResolver:
+    """
+    In-memory "first last" -> player_id map, optionally creating players that don't exist yet
+    """
+
+    def __init__(self, conn: sqlite3.Connection, default_rating: int, create_missing: bool = False):
+        self.conn = conn
+        self.default_rating = default_rating
+        self.create_missing = create_missing
+        self.created = 0
+        with Connections.cursor(conn) as cursor:
+            cursor.execute("SELECT player_id, first_name, last_name FROM players")
+            self.ids = {self._key(f"{first} {last or ''}"): player_id for player_id, first, last in cursor.fetchall()}
+
+    @staticmethod
+    def _key(name: str) -> str:
+        return ' '.join(name.lower().split())
+
+    def resolve(self, name: Optional[str]) -> Optional[int]:
+        if name is None or not str(name).strip():
+            return None
+        key = self._key(str(name))
+        player_id = self.ids.get(key)
+        if player_id is None:
+            if not self.create_missing:
+                raise ValueError(f"Unknown player '{name}'")
+            first_name, _, last_name = str(name).strip().partition(' ')
+            with Connections.cursor(self.conn) as cursor:
+                cursor.execute("INSERT INTO players (first_name, last_name, rating) VALUES (?, ?, ?)",
+                               (first_name, last_name.strip() or None, self.default_rating))
+                player_id = cursor.lastrowid
+            self.ids[key] = player_id
+            self.created += 1
+        return player_id
+
+
+def _normalize_ts(value) -> Optional[str]:
+    if value is None or not str(value).strip():
+        return None
+    return datetime.fromisoformat(str(value).strip()).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def match_tuples(rows: Iterator[dict | str], resolver: NameResolver, summary: dict) -> Iterator[tuple]:
+    """
+    Converts raw rows into matches insert parameters, logging and skipping rows that don't validate
+    """
+    for line, row in enumerate(rows, start=1):
+        try:
+            if isinstance(row, str):
+                row = json.loads(row)
+            t1p1, t1p2, t2p1, t2p2 = (resolver.resolve(row.get(c)) for c in PLAYER_COLUMNS)
+            if t1p1 is None or t2p1 is None or (t1p2 is None) != (t2p2 is None):
+                raise ValueError("Team 1 and Team 2 not same size")
+            player_ids = [p for p in (t1p1, t1p2, t2p1, t2p2) if p is not None]
+            if len(set(player_ids)) != len(player_ids):
+                raise ValueError("Same player listed more than once")
+            yield (t1p1, t1p2, t2p1, t2p2, int(row['team_1_score']), int(row['team_2_score']),
+                   _normalize_ts(row.get('game_ts')))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            summary['skipped'] += 1
+            logger.warning(f"Skipping import row {line}: {e}")
+
+
+def import_file(conn: sqlite3.Connection, path: str, default_rating: int, create_missing: bool = False) -> dict:
+    """
+    Inserts every valid match in path with executemany batches, committing every BATCHES_PER_TRANSACTION batches.
+    Only the matches table (and any created players) is written, the caller rebuilds aggregates and ratings.
+    """
+    start = time.perf_counter()
+    summary = {'imported': 0, 'skipped': 0, 'created_players': 0}
+    resolver = NameResolver(conn, default_rating, create_missing)
+    matches = match_tuples(read_rows(path), resolver, summary)
+
+    with Connections.cursor(conn) as cursor:
+        while True:
+            with conn:
+                inserted = 0
+                for _ in range(BATCHES_PER_TRANSACTION):
+                    batch = list(islice(matches, BATCH_SIZE))
+                    if not batch:
+                        break
+                    cursor.executemany('''
+                        INSERT INTO matches (team_1_player_1_id, team_1_player_2_id, team_2_player_1_id, team_2_player_2_id,
+                                             team_1_score, team_2_score, game_ts)
+                        VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+                    ''', batch)
+                    inserted += len(batch)
+                summary['imported'] += inserted
+            if inserted < BATCH_SIZE * BATCHES_PER_TRANSACTION:
+                break
+
+    summary['created_players'] = resolver.created
+    summary['seconds'] = time.perf_counter() - start
+    return summary
+
+
+def main():
+    from app_server.backend.players import Player, DATABASE
+
+    parser = argparse.ArgumentParser(description='Bulk import historical matches from CSV or JSONL')
+    parser.add_argument('path')
+    parser.add_argument('--database', default=DATABASE)
+    parser.add_argument('--create-missing', action='store_true', help='create players that are not found by name')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    summary = Player(args.database).import_matches(args.path, args.create_missing)
+    print(summary)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import threading
+from bisect import bisect_left, insort
+from typing import Optional
+
+
+class Leaderboard:
+    """
+    In-memory ranking of every player, kept in leaderboard order so rank, neighbourhood and top-K lookups are a
+    bisect instead of ranking the whole roster. Ordered like LEADERBOARD_QUERY: rating then wins, highest first,
+    and players with no games are unranked. Ties on rating share a rank (1, 1, 3, ...).
+    """
+
+    def __init__(self, rows: list[tuple[int, int, int, int]]):
+        """
+        :param rows: (player_id, rating, wins, games) for every player
+        """
+        self._lock = threading.RLock()
+        self._players: dict[int, tuple[int, int, int]] = {}
+        self._keys: list[tuple[int, int, int]] = []
+        for player_id, rating, wins, games in rows:
+            self._players[player_id] = (rating, wins, games)
+            if games > 0:
+                self._keys.append(self._key(player_id, rating, wins))
+        self._keys.sort()
+
+    @staticmethod
+    def _key(player_id: int, rating: int, wins: int) -> tuple[int, int, int]:
+        return -rating, -wins, player_id
+
+    def __len__(self) -> int:
+        """
+        Number of ranked players
+        """
+        return len(self._keys)
+
+    def update(self, player_id: int, rating: int, wins: int, games: int):
+        """
+        Moves a player to their new position after a rating or record change
+        """
+        with self._lock:
+            old = self._players.get(player_id)
+            if old and old[2] > 0:
+                del self._keys[bisect_left(self._keys, self._key(player_id, old[0], old[1]))]
+            self._players[player_id] = (rating, wins, games)
+            if games > 0:
+                insort(self._keys, self._key(player_id, rating, wins))
+
+    def stats(self, player_id: int) -> Optional[tuple[int, int, int]]:
+        """
+        :return: (rating, wins, games), None for an unknown player
+        """
+        return self._players.get(player_id)
+
+    def rank(self, player_id: int) -> Optional[int]:
+        """
+        1 + the number of ranked players with a strictly higher rating, None if the player is unranked
+        """
+        with self._lock:
+            stats = self._players.get(player_id)
+            if not stats or stats[2] == 0:
+                return None
+            return bisect_left(self._keys, (-stats[0],)) + 1
+
+    def _entries(self, start: int, stop: int) -> list[tuple[int, int]]:
+        """
+        (player_id, rank) for positions start..stop of the ranking
+        """
+        with self._lock:
+            keys = self._keys[max(start, 0):stop]
+            return [(key[2], bisect_left(self._keys, (key[0],)) + 1) for key in keys]
+
+    def top(self, count: int) -> list[tuple[int, int]]:
+        """
+        :return: (player_id, rank) for the first count ranked players
+        """
+        return self._entries(0, count)
+
+    def around(self, player_id: int, radius: int = 2) -> list[tuple[int, int]]:
+        """
+        :return: (player_id, rank) for the player and up to radius players either side of them, empty if unranked
+        """
+        with self._lock:
+            stats = self._players.get(player_id)
+            if not stats or stats[2] == 0:
+                return []
+            position = bisect_left(self._keys, self._key(player_id, stats[0], stats[1]))
+            return self._entries(position - radius, position + radius + 1)
@@ -0,0 +1,64 @@
+import os
+import sqlite3
+from typing import Optional
+
+from app_server.backend.players import DATABASE
+from app_server.backend.store import AsyncPlayerStore, StorePool, default_pool
+
+# one SQLite file per Discord server so leagues never share a leaderboard or a writer lock
+LEAGUE_DIRECTORY = os.getenv('LEAGUE_DIRECTORY', 'leagues')
+# the server whose league lives in the original single DATABASE file, so existing data stays with it
+LEGACY_GUILD_ID = os.getenv('LEGACY_GUILD_ID')
+
+
+class LeagueRegistry:
+    """
+    Routes each guild to its own AsyncPlayerStore, all sharing one bounded StorePool
+    """
+
+    def __init__(self, directory: str = LEAGUE_DIRECTORY, legacy_guild_id: Optional[str] = LEGACY_GUILD_ID,
+                 pool: Optional[StorePool] = None):
+        self.directory = directory
+        self.legacy_guild_id = str(legacy_guild_id) if legacy_guild_id else None
+        self.pool = pool or default_pool()
+        self._stores: dict[str, AsyncPlayerStore] = {}
+
+    def check_legacy_database(self):
+        """
+        Refuses to run when the original DATABASE file has a league in it but no server is set to own it,
+        otherwise that server would silently start over with an empty league file
+        """
+        if self.legacy_guild_id or not os.path.exists(DATABASE):
+            return
+        conn = sqlite3.connect(DATABASE)
+        try:
+            has_players = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'players'").fetchone() is not None
+            has_data = has_players and conn.execute("SELECT 1 FROM players LIMIT 1").fetchone() is not None
+        finally:
+            conn.close()
+        if has_data:
+            raise RuntimeError(f"{DATABASE} has existing league data but LEGACY_GUILD_ID is not set, "
+                               f"set it to the id of the server that owns that league")
+
+    def database_for(self, guild_id: int) -> str:
+        """
+        The legacy guild uses the original DATABASE file, every other guild its own file
+        """
+        if guild_id is None:
+            raise ValueError("Leagues belong to a server, direct messages have no league")
+        if str(guild_id) == self.legacy_guild_id:
+            return DATABASE
+        return os.path.join(self.directory, f"league_{guild_id}.db")
+
+    def get(self, guild_id: int) -> AsyncPlayerStore:
+        database = self.database_for(guild_id)
+        store = self._stores.get(database)
+        if store is None:
+            if database != DATABASE:
+                os.makedirs(self.directory, exist_ok=True)
+            store = self._stores[database] = AsyncPlayerStore(database, self.pool)
+        return store
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,168 @@
+import random
+import time
+from itertools import combinations
+from typing import Optional
+
+from app_server.backend import rating as Rating
+
+DEFAULT_TIME_BUDGET = 0.25  # seconds
+DEFAULT_REPEAT_PENALTY = 5.0  # rating points added to a court's cost per previous game together as partners
+COURT_SIZE = 4
+EXHAUSTIVE_MAX_PLAYERS = 12  # 5775 ways to split 12 players into courts, few enough to try them all
+MAX_STALE_RESTARTS = 20  # random restarts in a row without a better assignment before giving up
+
+# the three ways to split four players into two teams, as positions within the court
+SPLITS = (((0, 1), (2, 3)), ((0, 2), (1, 3)), ((0, 3), (1, 2)))
+
+
+class Matchmaker:
+    """
+    Splits the players present into doubles courts so opposing team ratings are as close as possible.
+    Up to EXHAUSTIVE_MAX_PLAYERS every split into courts is tried. Beyond that, courts are seeded from rating order
+    then improved by swapping players between courts until no swap helps, with random restarts from the best
+    assignment until a perfect one is found, MAX_STALE_RESTARTS restarts in a row don't improve it or the time
+    budget runs out.
+    """
+
+    def __init__(self, ratings: dict[int, float], partner_counts: Optional[dict[tuple[int, int], int]] = None,
+                 repeat_penalty: float = DEFAULT_REPEAT_PENALTY, seed: Optional[int] = None):
+        """
+        :param ratings: player_id -> rating for every player present
+        :param partner_counts: (lower player_id, higher player_id) -> games previously played as partners
+        :param repeat_penalty: cost per previous partnership, 0 to ignore history
+        """
+        self.ratings = ratings
+        self.partner_counts = partner_counts or {}
+        self.repeat_penalty = repeat_penalty
+        self.rng = random.Random(seed)
+        # sorted court -> cost, the search revisits the same courts many times
+        self._court_costs: dict[tuple[int, ...], float] = {}
+
+    def _partner_cost(self, a: int, b: int) -> float:
+        if not self.repeat_penalty:
+            return 0.0
+        return self.repeat_penalty * self.partner_counts.get((a, b) if a < b else (b, a), 0)
+
+    def court_cost(self, court: list[int]) -> tuple[float, tuple]:
+        """
+        :return: lowest cost over the three team splits and that split
+        """
+        best = None
+        for team_1, team_2 in SPLITS:
+            t1 = [court[i] for i in team_1]
+            t2 = [court[i] for i in team_2]
+            gap = abs(Rating.calculate_team_rating(self.ratings[t1[0]], self.ratings[t1[1]]) -
+                      Rating.calculate_team_rating(self.ratings[t2[0]], self.ratings[t2[1]]))
+            cost = gap + self._partner_cost(*t1) + self._partner_cost(*t2)
+            if best is None or cost < best[0]:
+                best = (cost, (t1, t2))
+        return best
+
+    def _cost(self, court: list[int]) -> float:
+        key = tuple(sorted(court))
+        cost = self._court_costs.get(key)
+        if cost is None:
+            cost = self._court_costs[key] = self.court_cost(court)[0]
+        return cost
+
+    def _seed(self, players: list[int]) -> list[list[int]]:
+        ordered = sorted(players, key=lambda p: self.ratings[p], reverse=True)
+        return [ordered[i:i + COURT_SIZE] for i in range(0, len(ordered), COURT_SIZE)]
+
+    def _local_search(self, courts: list[list[int]], costs: list[float], deadline: float) -> float:
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = False
+            for c1 in range(len(courts)):
+                for c2 in range(c1 + 1, len(courts)):
+                    for i in range(COURT_SIZE):
+                        for j in range(COURT_SIZE):
+                            courts[c1][i], courts[c2][j] = courts[c2][j], courts[c1][i]
+                            cost_1 = self._cost(courts[c1])
+                            cost_2 = self._cost(courts[c2])
+                            if cost_1 + cost_2 < costs[c1] + costs[c2] - 1e-9:
+                                costs[c1], costs[c2] = cost_1, cost_2
+                                improved = True
+                            else:
+                                courts[c1][i], courts[c2][j] = courts[c2][j], courts[c1][i]
+                if time.perf_counter() >= deadline:
+                    break
+        return sum(costs)
+
+    def _exhaustive(self, players: list[int]) -> list[list[int]]:
+        """
+        Lowest total cost split of players into courts, trying every one
+        """
+        def search(remaining: tuple[int, ...]) -> tuple[float, list[list[int]]]:
+            if not remaining:
+                return 0.0, []
+            # the first remaining player is always on the next court, so each split is only visited once
+            first, rest = remaining[0], remaining[1:]
+            best = None
+            for others in combinations(rest, COURT_SIZE - 1):
+                court = (first,) + others
+                rest_cost, rest_courts = search(tuple(p for p in rest if p not in others))
+                total = self._cost(list(court)) + rest_cost
+                if best is None or total < best[0]:
+                    best = (total, [list(court)] + rest_courts)
+            return best
+
+        return search(tuple(players))[1]
+
+    def _perturb(self, courts: list[list[int]], swaps: int) -> list[list[int]]:
+        courts = [list(c) for c in courts]
+        for _ in range(swaps):
+            c1, c2 = self.rng.sample(range(len(courts)), 2)
+            i, j = self.rng.randrange(COURT_SIZE), self.rng.randrange(COURT_SIZE)
+            courts[c1][i], courts[c2][j] = courts[c2][j], courts[c1][i]
+        return courts
+
+    def make_courts(self, players: list[int], sit_out: Optional[list[int]] = None,
+                    time_budget: float = DEFAULT_TIME_BUDGET) -> dict:
+        """
+        :param players: player_ids present
+        :param sit_out: players to leave out of this round, picked at random if there are more than fit on courts
+        :return: courts ordered by rating, each with both teams and their ratings, plus who sits out
+        """
+        deadline = time.perf_counter() + time_budget
+        players = [int(p) for p in players]
+        sit_out = [int(p) for p in sit_out] if sit_out else []
+        playing = [p for p in players if p not in sit_out]
+        extra = len(playing) % COURT_SIZE
+        if extra:
+            benched = self.rng.sample(playing, extra)
+            sit_out += benched
+            playing = [p for p in playing if p not in benched]
+
+        courts = self._seed(playing)
+        if len(courts) > 1 and len(playing) <= EXHAUSTIVE_MAX_PLAYERS:
+            courts = self._exhaustive(playing)
+        elif len(courts) > 1:
+            costs = [self._cost(c) for c in courts]
+            best_total = self._local_search(courts, costs, deadline)
+            best = [list(c) for c in courts]
+            stale = 0
+            while best_total > 1e-9 and stale < MAX_STALE_RESTARTS and time.perf_counter() < deadline:
+                candidate = self._perturb(best, swaps=max(2, len(best) // 2))
+                candidate_costs = [self._cost(c) for c in candidate]
+                total = self._local_search(candidate, candidate_costs, deadline)
+                if total < best_total - 1e-9:
+                    best, best_total = candidate, total
+                    stale = 0
+                else:
+                    stale += 1
+            courts = best
+
+        result = []
+        for court in courts:
+            _, (team_1, team_2) = self.court_cost(court)
+            team_1_rating = Rating.calculate_team_rating(self.ratings[team_1[0]], self.ratings[team_1[1]])
+            team_2_rating = Rating.calculate_team_rating(self.ratings[team_2[0]], self.ratings[team_2[1]])
+            result.append({'team_1': team_1,
+                           'team_2': team_2,
+                           'team_1_rating': team_1_rating,
+                           'team_2_rating': team_2_rating,
+                           'gap': abs(team_1_rating - team_2_rating)
+                           })
+        result.sort(key=lambda c: c['team_1_rating'] + c['team_2_rating'], reverse=True)
+        return {'courts': result, 'sit_out': sit_out}
@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from app_server.backend import rating as Rating
+
+# singles rows kept per matrix, each row is one float64 per player on the roster
+SINGLES_ROW_CACHE = 256
+
+
+class MatchupMatrix:
+    """
+    Expected scores for every pairing of players on the roster. Singles rows are computed on first use rather than
+    as one N x N matrix, a prediction only reads a single cell and the matrix is rebuilt after every match.
+    """
+
+    def __init__(self, roster: list[tuple[int, int]]):
+        """
+        :param roster: (player_id, rating) for every player
+        """
+        self.player_ids = np.array([p[0] for p in roster], dtype=np.int64)
+        self.ratings = np.array([p[1] for p in roster], dtype=np.float64)
+        self.index = {player_id: i for i, player_id in enumerate(self.player_ids.tolist())}
+        self._singles: OrderedDict[int, np.ndarray] = OrderedDict()
+        self._singles_lock = threading.Lock()
+
+    def singles_row(self, player_id: int) -> np.ndarray:
+        """
+        :return: row where [j] is the expected score of player_id against the j-th player on the roster
+        """
+        i = self.index[int(player_id)]
+        with self._singles_lock:
+            row = self._singles.get(i)
+            if row is not None:
+                self._singles.move_to_end(i)
+                return row
+        row = Rating.calculate_expected_score_matrix(self.ratings[i:i + 1], self.ratings)[0]
+        with self._singles_lock:
+            self._singles[i] = row
+            if len(self._singles) > SINGLES_ROW_CACHE:
+                self._singles.popitem(last=False)
+        return row
+
+    def team_ratings(self, teams: list[list[int]]) -> np.ndarray:
+        player_1 = self.ratings[[self.index[int(t[0])] for t in teams]]
+        player_2 = np.array([self.ratings[self.index[int(t[1])]] if len(t) > 1 else np.nan for t in teams])
+        return Rating.calculate_team_ratings(player_1, player_2)
+
+    def predict(self, team_1: list[int], team_2: list[int]) -> dict:
+        if len(team_1) == 1 and len(team_2) == 1:
+            team_1_rating = self.ratings[self.index[int(team_1[0])]]
+            team_2_rating = self.ratings[self.index[int(team_2[0])]]
+            expected = self.singles_row(team_1[0])[self.index[int(team_2[0])]]
+        else:
+            team_1_rating, team_2_rating = self.team_ratings([team_1, team_2])
+            expected = Rating.calculate_expected_score(team_1_rating, team_2_rating)
+        return {'team_1_rating': float(team_1_rating),
+                'team_2_rating': float(team_2_rating),
+                'team_1_expected': float(expected),
+                'team_2_expected': float(1 - expected)
+                }
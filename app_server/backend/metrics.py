@@ -0,0 +1,173 @@
+import logging
+import math
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('bot_logger')
+
+# bucket upper bounds in milliseconds
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, math.inf)
+
+SQL_HISTOGRAM = 'sql_statement_ms'
+STAGE_HISTOGRAM = 'command_stage_ms'
+COMMAND_HISTOGRAM = 'command_ms'
+
+
+class Histogram:
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            self.count += 1
+            self.total += value
+
+    def percentile(self, q: float) -> float:
+        """
+        Estimated from the buckets, returns the upper bound of the bucket holding the q-th observation
+        """
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return BUCKETS[-1]
+
+    def summary(self) -> dict:
+        return {'count': self.count,
+                'mean_ms': self.total / self.count if self.count else 0.0,
+                'p50_ms': self.percentile(0.5),
+                'p95_ms': self.percentile(0.95),
+                'p99_ms': self.percentile(0.99)
+                }
+
+
+_histograms: dict[tuple, Histogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def histogram(name: str, **labels) -> Histogram:
+    key = (name, tuple(sorted(labels.items())))
+    hist = _histograms.get(key)
+    if hist is None:
+        with _histograms_lock:
+            hist = _histograms.setdefault(key, Histogram(name, labels))
+    return hist
+
+
+def observe(name: str, value: float, **labels):
+    histogram(name, **labels).observe(value)
+
+
+@contextmanager
+def timer(name: str, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, (time.perf_counter() - start) * 1000, **labels)
+
+
+def stage(command: str, stage_name: str):
+    """
+    Times one stage (query, dataframe, render, send, ...) of a bot command
+    """
+    return timer(STAGE_HISTOGRAM, command=command, stage=stage_name)
+
+
+def snapshot() -> list[dict]:
+    with _histograms_lock:
+        histograms = list(_histograms.values())
+    return [{'name': h.name, 'labels': h.labels, **h.summary()} for h in histograms]
+
+
+def export_prometheus() -> str:
+    """
+    All histograms in the Prometheus text exposition format
+    """
+    with _histograms_lock:
+        histograms = sorted(_histograms.values(), key=lambda h: (h.name, sorted(h.labels.items())))
+
+    lines = []
+    last_name = None
+    for h in histograms:
+        if h.name != last_name:
+            lines.append(f"# TYPE {h.name} histogram")
+            last_name = h.name
+        labels = ','.join(f'{k}="{v}"' for k, v in sorted(h.labels.items()))
+        prefix = f"{labels}," if labels else ''
+        cumulative = 0
+        for bound, count in zip(BUCKETS, h.counts):
+            cumulative += count
+            le = '+Inf' if bound == math.inf else f"{bound:g}"
+            lines.append(f'{h.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ''
+        lines.append(f"{h.name}_sum{suffix} {h.total}")
+        lines.append(f"{h.name}_count{suffix} {h.count}")
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path: str):
+    with open(path, 'w') as f:
+        f.write(export_prometheus())
+
+
+def reset():
+    with _histograms_lock:
+        _histograms.clear()
+
+
+def _statement_kind(sql: str) -> str:
+    words = sql.split(None, 1)
+    return words[0].upper() if words else 'EMPTY'
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor that records the duration of every statement by kind (SELECT, INSERT, ...)
+    """
+
+    def execute(self, sql, parameters=()):
+        with timer(SQL_HISTOGRAM, statement=_statement_kind(sql)):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        with timer(SQL_HISTOGRAM, statement=_statement_kind(sql)):
+            return super().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        with timer(SQL_HISTOGRAM, statement='SCRIPT'):
+            return super().executescript(sql_script)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    Pass as sqlite3.connect(factory=...) so every statement, including conn.execute shortcuts, is timed
+    """
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # the built-in shortcuts run statements on a plain cursor, route them through an InstrumentedCursor instead
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
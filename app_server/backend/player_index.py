@@ -0,0 +1,69 @@
+import heapq
+from bisect import bisect_left
+from itertools import islice
+from typing import Optional
+
+# Discord shows at most 25 autocomplete choices
+DEFAULT_LIMIT = 25
+# past this many matching names it's cheaper to walk the suggestion order until enough players match
+SCAN_THRESHOLD = 512
+
+
+def _normalize(text: Optional[str]) -> str:
+    return ' '.join((text or '').casefold().split())
+
+
+class PlayerIndex:
+    """
+    Prefix search over player names for autocomplete. Every first name, last name and full name is kept in one
+    sorted array so a prefix is a pair of bisects, and matches are ordered by most recent then most frequent play.
+    The names only need indexing when the roster changes, set_activity re-orders suggestions after new matches.
+    """
+
+    def __init__(self, players: list[dict]):
+        """
+        :param players: player directory entries ('player_id', 'first_name', 'last_name')
+        """
+        self.players = {p['player_id']: p for p in players}
+
+        self.names: dict[int, tuple[str, ...]] = {}
+        tokens = []
+        full_names = []
+        for p in players:
+            first, last = _normalize(p['first_name']), _normalize(p['last_name'])
+            full = f"{first} {last}".strip()
+            names = self.names[p['player_id']] = tuple({first, last, full} - {''})
+            tokens += [(token, p['player_id']) for token in names]
+            full_names.append((full, p['player_id']))
+        self.tokens = sorted(tokens)
+        self.alphabetical = [player_id for _, player_id in sorted(full_names)]
+        self.set_activity({})
+
+    def set_activity(self, activity: dict[int, tuple[str, int]]):
+        """
+        :param activity: player_id -> (last_played, games), players without games can be left out
+        """
+        # most recently played first, then most games, ties stay alphabetical since the sort is stable
+        ranked = sorted(self.alphabetical, key=lambda player_id: activity.get(player_id, ('', 0)), reverse=True)
+        # position in the suggestion order, lower is suggested first
+        self._ranking = ranked, {player_id: i for i, player_id in enumerate(ranked)}
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT) -> list[dict]:
+        """
+        Players with a first, last or full name starting with query, an empty query returns the most active players
+        """
+        ranked, order = self._ranking
+        query = _normalize(query)
+        if not query:
+            return [self.players[player_id] for player_id in ranked[:limit]]
+
+        start = bisect_left(self.tokens, (query,))
+        end = bisect_left(self.tokens, (query + '\uffff',))
+        if end - start > SCAN_THRESHOLD:
+            # a short, common prefix, matches are dense enough that the first few hundred players cover the limit
+            matches = (player_id for player_id in ranked
+                       if any(name.startswith(query) for name in self.names[player_id]))
+            return [self.players[player_id] for player_id in islice(matches, limit)]
+
+        player_ids = {player_id for _, player_id in self.tokens[start:end]}
+        return [self.players[player_id] for player_id in heapq.nsmallest(limit, player_ids, key=order.get)]
@@ -1,7 +1,17 @@
+import os
 import sqlite3
+import threading
 from typing import Optional
 
 from app_server.backend import rating as Rating
+from app_server.backend import replay as Replay
+from app_server.backend import importer as Importer
+from app_server.backend import downsample as Downsample
+from app_server.backend import connections as Connections
+from app_server.backend.matchup import MatchupMatrix
+from app_server.backend.leaderboard import Leaderboard
+from app_server.backend.player_index import PlayerIndex
+from app_server.backend.matchmaking import Matchmaker, DEFAULT_REPEAT_PENALTY
 import logging
 
 logger = logging.getLogger('bot_logger')
@@ -9,228 +19,724 @@ logger = logging.getLogger('bot_logger')
 DATABASE = 'pickle_rank.db'
 PLAYER_TABLE = 'players'
 MATCHES_TABLE = 'matches'
+PLAYER_STATS_TABLE = 'player_stats'
+MATCH_PARTICIPANTS_TABLE = 'match_participants'
+RATING_HISTORY_TABLE = 'rating_history'
+PAIR_STATS_TABLE = 'pair_stats'
+RATING_CHECKPOINTS_TABLE = 'rating_checkpoints'
+
+PARTNER = 'partner'
+OPPONENT = 'opponent'
 
 DEFAULT_RANK = 1500
 
+# players with no games are unranked; ties on rating share a rank (1, 1, 3, ...)
+LEADERBOARD_QUERY = '''
+    SELECT * FROM (
+        SELECT player_id, first_name, last_name, rating, games, wins, losses,
+               CASE WHEN games > 0 THEN RANK() OVER (PARTITION BY games > 0 ORDER BY rating DESC) END AS rank
+        FROM (
+            SELECT p.player_id, p.first_name, p.last_name, p.rating,
+                   COALESCE(s.games, 0) AS games, COALESCE(s.wins, 0) AS wins, COALESCE(s.losses, 0) AS losses
+            FROM players p
+            LEFT JOIN player_stats s ON s.player_id = p.player_id
+        )
+    )
+'''
 
 
-class Player:
+# bumped whenever players or matches change, shared by every Player on the same database
+_data_versions: dict[str, int] = {}
+_data_versions_lock = threading.Lock()
 
 
-    def __init__(self):
-        self.conn = sqlite3.connect(DATABASE)
-        self._create_tables()
+def get_data_version(database: str = DATABASE) -> int:
+    return _data_versions.get(database, 0)
 
-    def _create_tables(self):
-        cursor = self.conn.cursor()
 
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS players (
-                    player_id INTEGER PRIMARY KEY,
-                    first_name TEXT,
-                    last_name TEXT,
-                    discord_id INTEGER,
-                    rating INTEGER
-            )
-            ''')
+def _bump_data_version(database: str):
+    with _data_versions_lock:
+        _data_versions[database] = _data_versions.get(database, 0) + 1
 
+_matchup_cache: dict[str, tuple[int, MatchupMatrix]] = {}
+# (directory, data version, index), names are re-indexed per directory and re-ordered per version
+_player_index_cache: dict[str, tuple[dict, int, PlayerIndex]] = {}
 
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS matches(
-                match_id INTEGER PRIMARY KEY,
-                team_1_player_1_id INTEGER,
-                team_1_player_2_id INTEGER,
-                team_2_player_1_id INTEGER,
-                team_2_player_2_id INTEGER,
-                team_1_score INTEGER,
-                team_2_score INTEGER,
-                game_ts DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        self.conn.commit()
-        cursor.close()
-
-
-    def get_all_current_ranking(self) -> list[dict]:
-        players = []
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-
-
-        cursor.execute("SELECT * FROM players")
-        player_rows = cursor.fetchall()
-
-        for row in player_rows:
-            player_history = self._get_player_match_history(row[0])
-            player_history['rating'] = row[4]
-            name = row[1] + ' ' + row[2][0].upper() + '.'
-            player_history['name'] = name
-            players.append(player_history)
-
-        unranked_players = [p for p in players if p['games'] == 0]
-        for up in unranked_players:
-            up['rank'] = 'NR'
-        players = [p for p in players if p['games'] != 0]
-
-
-        sorted_players = sorted(players, key=lambda x: (x['rating'], x['wins']), reverse=True)
-        rank_val = 0
-        last_rating = -1
-        offset = 1
-        for p in sorted_players:
-            if p['rating'] != last_rating:
-                rank_val += offset
-                offset = 1
-            else:
-                offset += 1
-            p['rank'] = rank_val
-            last_rating = p['rating']
+# player_id -> player record with a precomputed display name, loaded once per database
+_directories: dict[str, dict[int, dict]] = {}
+_directories_lock = threading.Lock()
 
-        sorted_players.extend(unranked_players)
 
-        return sorted_players
+def display_name(first_name: str, last_name: Optional[str]) -> str:
+    return f"{first_name} {last_name[0].upper()}." if last_name else first_name
 
-    def get_player_matches(self, match_count: int, player_id: int, opp_id: Optional[int] = None):
 
-        cursor = self.conn.cursor()
-        if opp_id and int(opp_id) > 0:
-            cursor.execute("SELECT * FROM matches where (team_1_player_1_id = ? or team_1_player_2_id = ?) and (team_2_player_1_id = ? or team_2_player_2_id = ?) order by game_ts desc limit ?",
-                           (player_id, player_id, opp_id, opp_id, match_count))
-            match_rows_1 = cursor.fetchall()
-            cursor.execute(
-                "SELECT * FROM matches where (team_2_player_1_id = ? or team_2_player_2_id = ?) and (team_1_player_1_id = ? or team_1_player_2_id = ?) order by game_ts desc limit ?",
-                (player_id, player_id, opp_id, opp_id, match_count))
-            match_rows_2 = cursor.fetchall()
-        else:
-            cursor.execute(
-                "SELECT * FROM matches where team_1_player_1_id = ? or team_1_player_2_id = ? order by game_ts desc limit ?",
-                (player_id, player_id, match_count))
-            match_rows_1 = cursor.fetchall()
-            cursor.execute(
-                "SELECT * FROM matches where team_2_player_1_id = ? or team_2_player_2_id = ? order by game_ts desc limit ?",
-                (player_id, player_id, match_count))
-            match_rows_2 = cursor.fetchall()
-        cursor.execute("SELECT * FROM players")
-        player_list = cursor.fetchall()
+def _invalidate_directory(database: str):
+    with _directories_lock:
+        _directories.pop(database, None)
 
-        matches = []
-        for m in match_rows_1:
-            partner_id = m[2] if m[1] == player_id else m[1]
-            partner_name = next((f"{name[1]} {name[2][0].upper()}." if name[2] else name[1]
-                            for name in player_list if name[0] == partner_id), 'None')
-            opp_1_name = next((f"{name[1]} {name[2][0].upper()}." if name[2] else name[1]
-                            for name in player_list if name[0] == m[3]), None)
-            opp_2_name = next((f"{name[1]} {name[2][0].upper()}." if name[2] else name[1]
-                               for name in player_list if name[0] == m[4]), None)
-            opp_team = f"{opp_1_name} & {opp_2_name}" if opp_2_name else opp_1_name
-            matches.append({'result': 'Win' if m[5] > m[6] else 'Loss',
-                            'score': m[5],
-                            'opponent_score': m[6],
-                            'partner': partner_name,
-                            'opponent': opp_team,
-                            'date': m[7]
-                        })
+# in-memory ranking per database, loaded on first use and kept up to date by add_match
+_leaderboards: dict[str, Leaderboard] = {}
+_leaderboards_lock = threading.Lock()
 
-        for m in match_rows_2:
-            partner_id = m[4] if m[3] == player_id else m[3]
-            partner_name = next((f"{name[1]}{name[2][0].upper()}." if name[2] else name[1]
-                                 for name in player_list if name[0] == partner_id), 'None')
-            opp_1_name = next((f"{name[1]} {name[2][0].upper()}." if name[2] else name[1]
-                               for name in player_list if name[0] == m[1]), None)
-            opp_2_name = next((f"{name[1]} {name[2][0].upper()}." if name[2] else name[1]
-                               for name in player_list if name[0] == m[2]), None)
-            opp_team = f"{opp_1_name} & {opp_2_name}" if opp_2_name else opp_1_name
-            matches.append({'result': 'Win' if m[6] > m[5] else 'Loss',
-                            'score': m[6],
-                            'opponent_score': m[5],
-                            'partner': partner_name,
-                            'opponent': opp_team,
-                            'date': m[7]
-                            })
 
-        matches.sort(key=lambda x: x['date'], reverse=True)
-        return matches[0:match_count]
+def _invalidate_leaderboard(database: str):
+    # callers bump the data version first, so a load that started before the change can't be published after it
+    with _leaderboards_lock:
+        _leaderboards.pop(database, None)
 
+_initialized_databases: set[str] = set()
+_initialized_lock = threading.Lock()
 
 
+class Player:
 
 
+    def __init__(self, database: str = DATABASE, conn: Optional[sqlite3.Connection] = None):
+        self.database = database
+        self.conn = conn or Connections.connect(database)
+        # schema checks and backfills only need to run once per database per process
+        key = os.path.abspath(database) if database != ':memory:' else None
+        with _initialized_lock:
+            if key is None or key not in _initialized_databases:
+                self._create_tables()
+                if key:
+                    _initialized_databases.add(key)
+        self.get_leaderboard()
 
+    def cursor(self):
+        return Connections.cursor(self.conn)
 
+    def close(self):
+        self.conn.close()
 
+    def _create_tables(self):
+        with self.cursor() as cursor:
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS players (
+                        player_id INTEGER PRIMARY KEY,
+                        first_name TEXT,
+                        last_name TEXT,
+                        discord_id INTEGER,
+                        rating INTEGER
+                )
+                ''')
+
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS matches(
+                    match_id INTEGER PRIMARY KEY,
+                    team_1_player_1_id INTEGER,
+                    team_1_player_2_id INTEGER,
+                    team_2_player_1_id INTEGER,
+                    team_2_player_2_id INTEGER,
+                    team_1_score INTEGER,
+                    team_2_score INTEGER,
+                    game_ts DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
 
+            stats_exists = self._table_exists(cursor, PLAYER_STATS_TABLE)
+            participants_exists = self._table_exists(cursor, MATCH_PARTICIPANTS_TABLE)
+            history_exists = self._table_exists(cursor, RATING_HISTORY_TABLE)
+            pairs_exists = self._table_exists(cursor, PAIR_STATS_TABLE)
+            checkpoints_exist = self._table_exists(cursor, RATING_CHECKPOINTS_TABLE)
 
-    def _get_player_match_history(self, player_id: int) -> dict[str, int]:
+            # matches in rating order, for replaying everything after a checkpoint
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_matches_ts ON matches (game_ts, match_id)")
 
-        cursor = self.conn.cursor()
+            # aggregate of each player's match results, maintained by add_match so the leaderboard
+            # doesn't need to scan matches for every player
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS player_stats(
+                    player_id INTEGER PRIMARY KEY,
+                    games INTEGER NOT NULL DEFAULT 0,
+                    wins INTEGER NOT NULL DEFAULT 0,
+                    losses INTEGER NOT NULL DEFAULT 0,
+                    points_for INTEGER NOT NULL DEFAULT 0,
+                    points_against INTEGER NOT NULL DEFAULT 0,
+                    last_played DATETIME
+                )
+            ''')
+
+            # one row per player per match so per-player lookups can use an index instead of
+            # OR-ing across the four player columns of matches
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS match_participants(
+                    match_id INTEGER NOT NULL,
+                    player_id INTEGER NOT NULL,
+                    team INTEGER NOT NULL,
+                    is_winner INTEGER NOT NULL,
+                    game_ts DATETIME,
+                    PRIMARY KEY (match_id, player_id)
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_match_participants_player_ts
+                ON match_participants (player_id, game_ts, match_id)
+            ''')
 
-        cursor.execute("SELECT * FROM matches where team_1_player_1_id = ? or team_1_player_2_id = ?",
-                       (player_id, player_id))
-        # cursor.execute("SELECT * FROM matches where player_1_id = ?", (player_id,))
-        match_rows_1 = cursor.fetchall()
+            # every rating change, one row per participant per match
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS rating_history(
+                    player_id INTEGER NOT NULL,
+                    match_id INTEGER NOT NULL,
+                    rating_before INTEGER NOT NULL,
+                    rating_after INTEGER NOT NULL,
+                    delta INTEGER NOT NULL,
+                    PRIMARY KEY (player_id, match_id)
+                ) WITHOUT ROWID
+            ''')
 
-        cursor.execute(
-            "SELECT * FROM matches where team_2_player_1_id = ? or team_2_player_2_id = ?",
-            (player_id, player_id))
-        # cursor.execute("SELECT * FROM matches where player_2_id = ?", (player_id,))
-        match_rows_2 = cursor.fetchall()
+            # record of every pair of players who have played together or against each other, stored in both
+            # directions so any pair is a single primary key lookup from player_a's point of view
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS pair_stats(
+                    player_a INTEGER NOT NULL,
+                    relation TEXT NOT NULL,
+                    player_b INTEGER NOT NULL,
+                    games INTEGER NOT NULL DEFAULT 0,
+                    wins INTEGER NOT NULL DEFAULT 0,
+                    points_for INTEGER NOT NULL DEFAULT 0,
+                    points_against INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (player_a, relation, player_b)
+                ) WITHOUT ROWID
+            ''')
 
-        # games = len(match_rows_1)
-        games = len(match_rows_1) + len(match_rows_2)
-        wins = 0
-        losses = 0
+            # periodic snapshots of every rated player's rating, taken right after the match they point to, so
+            # editing or deleting a match only replays the matches since the checkpoint before it
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS rating_checkpoints(
+                    checkpoint_id INTEGER PRIMARY KEY,
+                    match_id INTEGER NOT NULL,
+                    game_ts DATETIME NOT NULL
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS checkpoint_ratings(
+                    checkpoint_id INTEGER NOT NULL,
+                    player_id INTEGER NOT NULL,
+                    rating INTEGER NOT NULL,
+                    games INTEGER NOT NULL,
+                    PRIMARY KEY (checkpoint_id, player_id)
+                ) WITHOUT ROWID
+            ''')
+            self.conn.commit()
 
-        for match in match_rows_1:
-            wins, losses = update_wins_losses(match[5], match[6], wins, losses)
+        if not participants_exists:
+            self.rebuild_match_participants()
+        if not stats_exists:
+            self.rebuild_player_stats()
+        if not pairs_exists:
+            self.rebuild_pair_stats()
+        if not history_exists or not checkpoints_exist:
+            Replay.replay_all(self.conn, DEFAULT_RANK, write_ratings=False)
+
+    @property
+    def data_version(self) -> int:
+        return get_data_version(self.database)
+
+    @staticmethod
+    def _table_exists(cursor: sqlite3.Cursor, table_name: str) -> bool:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,))
+        return cursor.fetchone() is not None
+
+    def rebuild_match_participants(self, after_match_id: Optional[int] = None):
+        """
+        Regenerates match_participants from the full matches table
+        :param after_match_id: only add rows for matches after this id, leaving existing rows alone
+        """
+        with self.cursor() as cursor:
+            if after_match_id is None:
+                cursor.execute("DELETE FROM match_participants")
+            cursor.execute('''
+                INSERT INTO match_participants (match_id, player_id, team, is_winner, game_ts)
+                SELECT match_id, player_id, team, is_winner, game_ts
+                FROM (
+                    SELECT match_id, team_1_player_1_id AS player_id, 1 AS team, team_1_score > team_2_score AS is_winner, game_ts FROM matches
+                    UNION ALL
+                    SELECT match_id, team_1_player_2_id, 1, team_1_score > team_2_score, game_ts FROM matches
+                    UNION ALL
+                    SELECT match_id, team_2_player_1_id, 2, team_2_score > team_1_score, game_ts FROM matches
+                    UNION ALL
+                    SELECT match_id, team_2_player_2_id, 2, team_2_score > team_1_score, game_ts FROM matches
+                )
+                WHERE player_id IS NOT NULL AND match_id > ?
+            ''', (after_match_id or 0,))
+            self.conn.commit()
 
-        for match in match_rows_2:
-            wins, losses = update_wins_losses(match[6], match[5], wins, losses)
+    def rebuild_player_stats(self):
+        """
+        Regenerates player_stats from the full matches table
+        """
+        with self.cursor() as cursor:
+            cursor.execute("DELETE FROM player_stats")
+            cursor.execute('''
+                INSERT INTO player_stats (player_id, games, wins, losses, points_for, points_against, last_played)
+                SELECT player_id, COUNT(*), SUM(score > opp_score), SUM(score <= opp_score), SUM(score), SUM(opp_score), MAX(game_ts)
+                FROM (
+                    SELECT team_1_player_1_id AS player_id, team_1_score AS score, team_2_score AS opp_score, game_ts FROM matches
+                    UNION ALL
+                    SELECT team_1_player_2_id, team_1_score, team_2_score, game_ts FROM matches
+                    UNION ALL
+                    SELECT team_2_player_1_id, team_2_score, team_1_score, game_ts FROM matches
+                    UNION ALL
+                    SELECT team_2_player_2_id, team_2_score, team_1_score, game_ts FROM matches
+                )
+                WHERE player_id IS NOT NULL
+                GROUP BY player_id
+            ''')
+            self.conn.commit()
+
+    def rebuild_pair_stats(self):
+        """
+        Regenerates pair_stats from match_participants
+        """
+        with self.cursor() as cursor:
+            cursor.execute("DELETE FROM pair_stats")
+            cursor.execute(f'''
+                INSERT INTO pair_stats (player_a, relation, player_b, games, wins, points_for, points_against)
+                SELECT a.player_id, CASE WHEN a.team = b.team THEN '{PARTNER}' ELSE '{OPPONENT}' END, b.player_id,
+                       COUNT(*), SUM(a.is_winner),
+                       SUM(CASE WHEN a.team = 1 THEN m.team_1_score ELSE m.team_2_score END),
+                       SUM(CASE WHEN a.team = 1 THEN m.team_2_score ELSE m.team_1_score END)
+                FROM match_participants a
+                JOIN match_participants b ON b.match_id = a.match_id AND b.player_id != a.player_id
+                JOIN matches m ON m.match_id = a.match_id
+                GROUP BY a.player_id, a.team = b.team, b.player_id
+            ''')
+            self.conn.commit()
+
+
+    def get_all_current_ranking(self, limit: Optional[int] = None, offset: int = 0) -> list[dict]:
+        """
+        Ranked players ordered by rating then wins, followed by the unranked (no games) players
+        :param limit: max number of rows to return, all rows when None
+        :param offset: number of rows to skip, for paging through the leaderboard
+        """
+        with self.cursor() as cursor:
+            cursor.execute(LEADERBOARD_QUERY + " ORDER BY games = 0, rank, wins DESC, player_id LIMIT ? OFFSET ?",
+                           (-1 if limit is None else limit, offset))
+            player_rows = cursor.fetchall()
+
+        return [_leaderboard_row(row) for row in player_rows]
+
+    def get_player_rank(self, player_id: int) -> Optional[dict]:
+        """
+        Leaderboard row for a single player, rank is 'NR' if they have no games
+        """
+        leaderboard = self.get_leaderboard()
+        return self._rank_row(player_id, leaderboard.rank(player_id), leaderboard, self.get_player_directory())
+
+    def get_rank_neighbourhood(self, player_id: int, radius: int = 2) -> list[dict]:
+        """
+        Leaderboard rows for the player and up to radius players ranked either side of them, empty if unranked
+        """
+        leaderboard = self.get_leaderboard()
+        directory = self.get_player_directory()
+        return [self._rank_row(pid, rank, leaderboard, directory) for pid, rank in leaderboard.around(player_id, radius)]
+
+    def get_top_players(self, count: int) -> list[dict]:
+        """
+        Leaderboard rows for the first count ranked players
+        """
+        leaderboard = self.get_leaderboard()
+        directory = self.get_player_directory()
+        return [self._rank_row(pid, rank, leaderboard, directory) for pid, rank in leaderboard.top(count)]
+
+    @staticmethod
+    def _rank_row(player_id: int, rank: Optional[int], leaderboard: Leaderboard, directory: dict[int, dict]) -> Optional[dict]:
+        stats = leaderboard.stats(player_id)
+        if stats is None or player_id not in directory:
+            return None
+        rating, wins, games = stats
+        player = directory[player_id]
+        return _leaderboard_row((player_id, player['first_name'], player['last_name'], rating, games, wins,
+                                 games - wins, rank))
+
+    def get_leaderboard(self) -> Leaderboard:
+        """
+        Cached in-memory Leaderboard shared by every Player on the database
+        """
+        while True:
+            leaderboard = _leaderboards.get(self.database)
+            if leaderboard is not None:
+                return leaderboard
+
+            # a write that commits during the load finds no leaderboard to update, so its version bump sends us round
+            # again rather than publishing a leaderboard from before the commit
+            version = self.data_version
+            with self.cursor() as cursor:
+                cursor.execute('''
+                    SELECT p.player_id, p.rating, COALESCE(s.wins, 0), COALESCE(s.games, 0) FROM players p
+                    LEFT JOIN player_stats s ON s.player_id = p.player_id
+                ''')
+                leaderboard = Leaderboard(cursor.fetchall())
+            with _leaderboards_lock:
+                if self.data_version == version:
+                    return _leaderboards.setdefault(self.database, leaderboard)
+
+    def get_player_matches(self, match_count: int, player_id: int, opp_id: Optional[int] = None):
+        return self.get_player_matches_page(match_count, player_id, opp_id)[0]
+
+    def get_player_matches_page(self, match_count: int, player_id: int, opp_id: Optional[int] = None,
+                                before: Optional[tuple[str, int]] = None) -> tuple[list[dict], Optional[tuple[str, int]]]:
+        """
+        One page of a player's matches, newest first, using keyset pagination on (game_ts, match_id)
+        :param before: cursor returned by the previous page, None for the most recent matches
+        :return: the page of matches and the cursor for the next (older) page, None if this is the last page
+        """
+        if match_count < 1:
+            return [], None
+
+        filters = ''
+        params = [player_id]
+        if opp_id and int(opp_id) > 0:
+            filters += '''
+                  AND EXISTS (SELECT 1 FROM match_participants opp
+                              WHERE opp.match_id = me.match_id AND opp.player_id = ? AND opp.team != me.team)'''
+            params.append(opp_id)
+        if before:
+            filters += '''
+                  AND (me.game_ts, me.match_id) < (?, ?)'''
+            params.extend(before)
+        params.append(match_count + 1)
+
+        with self.cursor() as cursor:
+            cursor.execute(f'''
+                SELECT m.*, me.team FROM match_participants me
+                JOIN matches m ON m.match_id = me.match_id
+                WHERE me.player_id = ?{filters}
+                ORDER BY me.game_ts DESC, me.match_id DESC
+                LIMIT ?
+            ''', params)
+            match_rows = cursor.fetchall()
+        next_cursor = None
+        if len(match_rows) > match_count:
+            match_rows = match_rows[:match_count]
+            next_cursor = (match_rows[-1][7], match_rows[-1][0])
+        directory = self.get_player_directory()
+
+        matches = []
+        for m in match_rows:
+            if m[8] == 1:
+                team, opp_team_ids, score, opp_score = (m[1], m[2]), (m[3], m[4]), m[5], m[6]
+            else:
+                team, opp_team_ids, score, opp_score = (m[3], m[4]), (m[1], m[2]), m[6], m[5]
+            partner_id = team[1] if team[0] == int(player_id) else team[0]
+            partner_name = directory[partner_id]['display_name'] if partner_id in directory else 'None'
+            opp_1_name = directory[opp_team_ids[0]]['display_name'] if opp_team_ids[0] in directory else None
+            opp_2_name = directory[opp_team_ids[1]]['display_name'] if opp_team_ids[1] in directory else None
+            opp_team = f"{opp_1_name} & {opp_2_name}" if opp_2_name else opp_1_name
+            matches.append({'result': 'Win' if score > opp_score else 'Loss',
+                            'score': score,
+                            'opponent_score': opp_score,
+                            'partner': partner_name,
+                            'opponent': opp_team,
+                            'date': m[7],
+                            'match_id': m[0]
+                        })
+
+        return matches, next_cursor
+
+    def _get_player_match_history(self, player_id: int) -> dict[str, int]:
+
+        with self.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*), COALESCE(SUM(is_winner), 0) FROM match_participants WHERE player_id = ?",
+                           (player_id,))
+            games, wins = cursor.fetchone()
+        losses = games - wins
 
         return { 'wins': wins, 'losses': losses, 'games': games, 'percent' : wins/games * 100 if games > 0 else 0}
 
 
     def create_new_player(self, first_name: str, last_name: str, discord_id: int = None) -> bool:
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("INSERT INTO players (first_name, last_name, rating, discord_id) VALUES (?, ?, ?, ?)",
-                           (first_name, last_name, DEFAULT_RANK, discord_id))
-            self.conn.commit()
-            cursor.close()
+            with self.cursor() as cursor:
+                cursor.execute("INSERT INTO players (first_name, last_name, rating, discord_id) VALUES (?, ?, ?, ?)",
+                               (first_name, last_name, DEFAULT_RANK, discord_id))
+                player_id = cursor.lastrowid
+                self.conn.commit()
         except Exception as e:
             logger.error(f'Error occurred: {e}')
             return False
 
+        with _leaderboards_lock:
+            leaderboard = _leaderboards.get(self.database)
+            if leaderboard is not None:
+                leaderboard.update(player_id, DEFAULT_RANK, 0, 0)
+            _bump_data_version(self.database)
+        _invalidate_directory(self.database)
         return True
 
-    def update_discord_id(self, player_id:int, discord_id: int):
-        cursor = self.conn.cursor()
-        cursor.execute("UPDATE players SET discord_id = ? where player_id = ?", (discord_id, player_id))
-        self.conn.commit()
-        cursor.close()
+    def update_discord_id(self, player_id:int, discord_id: int) -> bool:
+        """
+        Links a Discord account to a player that isn't linked yet, an existing link is never overwritten
+        :return: False if the player is already linked to an account
+        """
+        with self.cursor() as cursor:
+            cursor.execute("UPDATE players SET discord_id = ? where player_id = ? AND discord_id IS NULL",
+                           (discord_id, player_id))
+            linked = cursor.rowcount == 1
+            self.conn.commit()
+        _invalidate_directory(self.database)
+        return linked
+
+    def get_player_directory(self) -> dict[int, dict]:
+        """
+        Cached player_id -> {'player_id', 'first_name', 'last_name', 'discord_id', 'display_name'},
+        shared by every Player on the database and reloaded after players are added or changed
+        """
+        directory = _directories.get(self.database)
+        if directory is not None:
+            return directory
+
+        with _directories_lock:
+            directory = _directories.get(self.database)
+            if directory is None:
+                with self.cursor() as cursor:
+                    cursor.execute("SELECT player_id, first_name, last_name, discord_id FROM players ORDER BY player_id")
+                    directory = {
+                        p[0]: {'player_id': p[0], 'first_name': p[1], 'last_name': p[2], 'discord_id': p[3],
+                               'display_name': display_name(p[1], p[2])}
+                        for p in cursor.fetchall()
+                    }
+                _directories[self.database] = directory
+        return directory
     def add_match(self, team_1: list[int], team_2: list[int], team_1_score:int, team_2_score:int):
-        cursor = self.conn.cursor()
-        if len(team_1) == 1 and len(team_2) == 1:
+        self.add_matches([(team_1, team_2, team_1_score, team_2_score)])
+        return True
+
+    def add_matches(self, matches: list[tuple[list[int], list[int], int, int]]) -> list[dict]:
+        """
+        Records matches in the given order in a single transaction, either all of them are saved or none are
+        :param matches: (team_1, team_2, team_1_score, team_2_score) for each match
+        :return: for each match {'match_id', 'ratings': {player_id: {'rating_before', 'rating_after', 'delta'}}}
+        """
+        for team_1, team_2, _, _ in matches:
+            self.check_teams(team_1, team_2)
+
+        # each match, its aggregates and every rating change commit together or not at all
+        with self.conn:
+            with self.cursor() as cursor:
+                recorded = [self.__record_match(cursor, *match) for match in matches]
+                self.__checkpoint_if_due(cursor, recorded[-1][0]['match_id'])
+
+        # only once the matches have committed, a rolled back match never reaches the leaderboard. Standings are
+        # absolute, so a leaderboard loaded after the commit already matches them and applying them again is harmless
+        with _leaderboards_lock:
+            leaderboard = _leaderboards.get(self.database)
+            if leaderboard is not None:
+                for _, standings in recorded:
+                    for player_id, (rating, wins, games) in standings.items():
+                        leaderboard.update(player_id, rating, wins, games)
+            _bump_data_version(self.database)
+        return [result for result, _ in recorded]
+
+    @staticmethod
+    def __checkpoint_if_due(cursor: sqlite3.Cursor, match_id: int):
+        """
+        Snapshots every rated player's rating after match_id once enough matches have been played since the last one
+        """
+        cursor.execute("SELECT game_ts, match_id FROM rating_checkpoints ORDER BY checkpoint_id DESC LIMIT 1")
+        last = cursor.fetchone()
+        cursor.execute("SELECT COUNT(*) FROM matches WHERE (game_ts, match_id) > (?, ?)", last or ('', 0))
+        since = cursor.fetchone()[0]
+        if since < Replay.CHECKPOINT_INTERVAL:
+            return
+        cursor.execute("SELECT COUNT(*) FROM players")
+        if since < Replay.checkpoint_interval(cursor.fetchone()[0]):
+            return
+
+        cursor.execute("INSERT INTO rating_checkpoints (match_id, game_ts) SELECT match_id, game_ts FROM matches "
+                       "WHERE match_id = ?", (match_id,))
+        cursor.execute('''
+            INSERT INTO checkpoint_ratings (checkpoint_id, player_id, rating, games)
+            SELECT ?, p.player_id, p.rating, s.games FROM players p
+            JOIN player_stats s ON s.player_id = p.player_id
+            WHERE s.games > 0
+        ''', (cursor.lastrowid,))
+
+    @staticmethod
+    def check_teams(team_1: list[int], team_2: list[int]):
+        if not ((len(team_1) == 1 and len(team_2) == 1) or (len(team_1) == 2 and len(team_2) == 2)):
+            raise Exception("Team 1 and Team 2 not same size")
+
+    def __record_match(self, cursor: sqlite3.Cursor, team_1: list[int], team_2: list[int], team_1_score: int, team_2_score: int) -> tuple[dict, dict[int, tuple[int, int, int]]]:
+        """
+        :return: the add_matches result for the match, and player_id -> (rating, wins, games) after it
+        """
+        if len(team_1) == 1:
             cursor.execute(
                 "INSERT INTO matches (team_1_player_1_id, team_2_player_1_id, team_1_score, team_2_score) VALUES (?, ?, ?, ?)",
                 (team_1[0], team_2[0], team_1_score, team_2_score))
-        elif len(team_1) == 2 and len(team_2) == 2:
+        else:
             cursor.execute(
                 "INSERT INTO matches (team_1_player_1_id, team_1_player_2_id, team_2_player_1_id, team_2_player_2_id, team_1_score, team_2_score) VALUES (?, ?, ?, ?, ?, ?)",
                 (team_1[0], team_1[1], team_2[0], team_2[1], team_1_score, team_2_score))
-        else:
-            raise Exception("Team 1 and Team 2 not same size")
-        self.conn.commit()
-
-        self.__update_player_ratings(team_1, team_2, team_1_score, team_2_score)
-
-        cursor.close()
-        return True
-
-    def __update_player_ratings(self, team_1: list[int], team_2: list[int], team_1_score: int, team_2_score: int):
-        team_1_player_1 = self.__get_player_stats(team_1[0])
-        team_1_player_2 = self.__get_player_stats(team_1[1]) if len(team_1) > 1  else (None, None)
-        team_2_player_1 = self.__get_player_stats(team_2[0])
-        team_2_player_2 = self.__get_player_stats(team_2[1]) if len(team_2) > 1 else (None, None)
+        match_id = cursor.lastrowid
+        cursor.execute("SELECT game_ts FROM matches WHERE match_id = ?", (match_id,))
+        game_ts = cursor.fetchone()[0]
+        self._insert_participants(cursor, match_id, game_ts, team_1, team_2, team_1_score, team_2_score)
+        self._update_player_stats(cursor, team_1, team_1_score, team_2_score, game_ts)
+        self._update_player_stats(cursor, team_2, team_2_score, team_1_score, game_ts)
+        self._update_pair_stats(cursor, team_1, team_2, team_1_score, team_2_score)
+
+        changes = self.__update_player_ratings(cursor, match_id, team_1, team_2, team_1_score, team_2_score)
+        result = {'match_id': match_id,
+                  'ratings': {int(player_id): {'rating_before': before, 'rating_after': after, 'delta': after - before}
+                              for player_id, (before, after, _, _) in changes.items()}}
+        return result, {int(player_id): (after, wins, games) for player_id, (_, after, games, wins) in changes.items()}
+
+    @staticmethod
+    def _insert_participants(cursor: sqlite3.Cursor, match_id: int, game_ts: str, team_1: list[int], team_2: list[int],
+                             team_1_score: int, team_2_score: int):
+        cursor.executemany(
+            "INSERT INTO match_participants (match_id, player_id, team, is_winner, game_ts) VALUES (?, ?, ?, ?, ?)",
+            [(match_id, p, 1, int(team_1_score > team_2_score), game_ts) for p in team_1] +
+            [(match_id, p, 2, int(team_2_score > team_1_score), game_ts) for p in team_2])
+
+    def edit_match(self, match_id: int, team_1: list[int], team_2: list[int], team_1_score: int, team_2_score: int) -> Optional[dict]:
+        """
+        Corrects a recorded match's players and scores, keeping its place in the history
+        :return: summary of the rating recompute, None if there is no such match
+        """
+        self.check_teams(team_1, team_2)
+        return self.__change_match(match_id, (team_1, team_2, team_1_score, team_2_score))
+
+    def delete_match(self, match_id: int) -> Optional[dict]:
+        """
+        Removes a recorded match
+        :return: summary of the rating recompute, None if there is no such match
+        """
+        return self.__change_match(match_id, None)
+
+    def __change_match(self, match_id: int, match: Optional[tuple[list[int], list[int], int, int]]) -> Optional[dict]:
+        """
+        Applies an edit (or a delete when match is None) then recomputes ratings starting from the last checkpoint
+        before the match, so only the matches after it are replayed. Everything commits together.
+        """
+        with self.cursor() as cursor:
+            cursor.execute("SELECT game_ts FROM matches WHERE match_id = ?", (match_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            game_ts = row[0]
+
+            with self.conn:
+                cursor.execute("SELECT player_id FROM match_participants WHERE match_id = ?", (match_id,))
+                affected = {row[0] for row in cursor.fetchall()}
+                cursor.execute("DELETE FROM match_participants WHERE match_id = ?", (match_id,))
+                cursor.execute("DELETE FROM rating_history WHERE match_id = ?", (match_id,))
+                if match is None:
+                    cursor.execute("DELETE FROM matches WHERE match_id = ?", (match_id,))
+                else:
+                    team_1, team_2, team_1_score, team_2_score = match
+                    cursor.execute('''
+                        UPDATE matches SET team_1_player_1_id = ?, team_1_player_2_id = ?, team_2_player_1_id = ?,
+                                           team_2_player_2_id = ?, team_1_score = ?, team_2_score = ?
+                        WHERE match_id = ?
+                    ''', (team_1[0], team_1[1] if len(team_1) > 1 else None, team_2[0],
+                          team_2[1] if len(team_2) > 1 else None, team_1_score, team_2_score, match_id))
+                    self._insert_participants(cursor, match_id, game_ts, team_1, team_2, team_1_score, team_2_score)
+                    affected |= {int(p) for p in team_1 + team_2}
+                self.__refresh_aggregates(cursor, sorted(affected))
+
+                cursor.execute('''
+                    SELECT checkpoint_id, game_ts, match_id FROM rating_checkpoints
+                    WHERE (game_ts, match_id) < (?, ?)
+                    ORDER BY checkpoint_id DESC LIMIT 1
+                ''', (game_ts, match_id))
+                summary = Replay.replay_from_checkpoint(self.conn, DEFAULT_RANK, cursor.fetchone())
+
+        _bump_data_version(self.database)
+        _invalidate_leaderboard(self.database)
+        logger.info(f"{'Edited' if match else 'Deleted'} match {match_id}: {summary}")
+        return summary
+
+    @staticmethod
+    def __refresh_aggregates(cursor: sqlite3.Cursor, player_ids: list[int]):
+        """
+        Recomputes player_stats and pair_stats rows for the given players from match_participants
+        """
+        placeholders = ', '.join('?' for _ in player_ids)
+        cursor.execute(f"DELETE FROM player_stats WHERE player_id IN ({placeholders})", player_ids)
+        cursor.execute(f'''
+            INSERT INTO player_stats (player_id, games, wins, losses, points_for, points_against, last_played)
+            SELECT mp.player_id, COUNT(*), SUM(mp.is_winner), SUM(1 - mp.is_winner),
+                   SUM(CASE WHEN mp.team = 1 THEN m.team_1_score ELSE m.team_2_score END),
+                   SUM(CASE WHEN mp.team = 1 THEN m.team_2_score ELSE m.team_1_score END),
+                   MAX(mp.game_ts)
+            FROM match_participants mp
+            JOIN matches m ON m.match_id = mp.match_id
+            WHERE mp.player_id IN ({placeholders})
+            GROUP BY mp.player_id
+        ''', player_ids)
+
+        # pair rows are stored both ways, so refresh the rows from the players' side and the mirrored rows
+        cursor.execute(f"DELETE FROM pair_stats WHERE player_a IN ({placeholders}) OR player_b IN ({placeholders})",
+                       player_ids * 2)
+        for driver, other in (('a', 'b'), ('b', 'a')):
+            cursor.execute(f'''
+                INSERT INTO pair_stats (player_a, relation, player_b, games, wins, points_for, points_against)
+                SELECT a.player_id, CASE WHEN a.team = b.team THEN '{PARTNER}' ELSE '{OPPONENT}' END, b.player_id,
+                       COUNT(*), SUM(a.is_winner),
+                       SUM(CASE WHEN a.team = 1 THEN m.team_1_score ELSE m.team_2_score END),
+                       SUM(CASE WHEN a.team = 1 THEN m.team_2_score ELSE m.team_1_score END)
+                FROM match_participants {driver}
+                JOIN match_participants {other} ON {other}.match_id = {driver}.match_id AND b.player_id != a.player_id
+                JOIN matches m ON m.match_id = a.match_id
+                WHERE {driver}.player_id IN ({placeholders})
+                  {'AND a.player_id NOT IN (' + placeholders + ')' if driver == 'b' else ''}
+                GROUP BY a.player_id, a.team = b.team, b.player_id
+            ''', player_ids * (2 if driver == 'b' else 1))
+
+    @staticmethod
+    def _update_player_stats(cursor: sqlite3.Cursor, team: list[int], team_score: int, opp_score: int, game_ts: str):
+        win = 1 if team_score > opp_score else 0
+        for player_id in team:
+            cursor.execute('''
+                INSERT INTO player_stats (player_id, games, wins, losses, points_for, points_against, last_played)
+                VALUES (?, 1, ?, ?, ?, ?, ?)
+                ON CONFLICT(player_id) DO UPDATE SET
+                    games = games + 1,
+                    wins = wins + excluded.wins,
+                    losses = losses + excluded.losses,
+                    points_for = points_for + excluded.points_for,
+                    points_against = points_against + excluded.points_against,
+                    last_played = MAX(COALESCE(last_played, excluded.last_played), excluded.last_played)
+            ''', (player_id, win, 1 - win, team_score, opp_score, game_ts))
+
+    @staticmethod
+    def _update_pair_stats(cursor: sqlite3.Cursor, team_1: list[int], team_2: list[int], team_1_score: int, team_2_score: int):
+        # every (player, other player) row the match touches, upserted in one statement
+        rows = []
+        for team, opp_team, score, opp_score in ((team_1, team_2, team_1_score, team_2_score),
+                                                 (team_2, team_1, team_2_score, team_1_score)):
+            win = 1 if score > opp_score else 0
+            for player_id in team:
+                rows += [(player_id, PARTNER, partner_id, win, score, opp_score) for partner_id in team if partner_id != player_id]
+                rows += [(player_id, OPPONENT, opp_id, win, score, opp_score) for opp_id in opp_team]
+
+        cursor.execute(f'''
+            INSERT INTO pair_stats (player_a, relation, player_b, games, wins, points_for, points_against)
+            VALUES {', '.join('(?, ?, ?, 1, ?, ?, ?)' for _ in rows)}
+            ON CONFLICT(player_a, relation, player_b) DO UPDATE SET
+                games = games + 1,
+                wins = wins + excluded.wins,
+                points_for = points_for + excluded.points_for,
+                points_against = points_against + excluded.points_against
+        ''', [value for row in rows for value in row])
+
+    def __update_player_ratings(self, cursor: sqlite3.Cursor, match_id: int, team_1: list[int], team_2: list[int], team_1_score: int, team_2_score: int) -> dict[int, tuple[int, int, int, int]]:
+        """
+        :return: player_id -> (rating_before, rating_after, games, wins)
+        """
+        team_1_player_1 = self.__get_player_stats(cursor, team_1[0])
+        team_1_player_2 = self.__get_player_stats(cursor, team_1[1]) if len(team_1) > 1  else (None, None, None)
+        team_2_player_1 = self.__get_player_stats(cursor, team_2[0])
+        team_2_player_2 = self.__get_player_stats(cursor, team_2[1]) if len(team_2) > 1 else (None, None, None)
 
         team_1_rating = Rating.calculate_team_rating(team_1_player_1[0], team_1_player_2[0])
         team_2_rating = Rating.calculate_team_rating(team_2_player_1[0], team_2_player_2[0])
@@ -246,50 +752,251 @@ class Player:
         loser_score = min(team_1_score, team_2_score)
         score_difference = winner_score - loser_score
 
+        ratings = {}
         team_1_player_1_update = Rating.calculate_player_ranking_update(team_1_rating, team_2_rating, team_1_score_calc, team_1_player_1[1], score_difference)
-        self.__update_rating(team_1[0], int(team_1_player_1[0] + team_1_player_1_update))
+        ratings[team_1[0]] = self.__update_rating(cursor, match_id, team_1[0], team_1_player_1[0], int(team_1_player_1[0] + team_1_player_1_update)) + team_1_player_1[1:]
         if len(team_1) > 1:
             team_1_player_2_update = Rating.calculate_player_ranking_update(team_1_rating, team_2_rating, team_1_score_calc, team_1_player_2[1], score_difference)
-            self.__update_rating(team_1[1], int(team_1_player_2[0] + team_1_player_2_update))
+            ratings[team_1[1]] = self.__update_rating(cursor, match_id, team_1[1], team_1_player_2[0], int(team_1_player_2[0] + team_1_player_2_update)) + team_1_player_2[1:]
         team_2_player_1_update = Rating.calculate_player_ranking_update(team_2_rating, team_1_rating, team_2_score_calc, team_2_player_1[1], score_difference)
-        self.__update_rating(team_2[0], int(team_2_player_1[0] + team_2_player_1_update))
+        ratings[team_2[0]] = self.__update_rating(cursor, match_id, team_2[0], team_2_player_1[0], int(team_2_player_1[0] + team_2_player_1_update)) + team_2_player_1[1:]
         if len(team_2) > 1:
             team_2_player_2_update = Rating.calculate_player_ranking_update(team_2_rating, team_1_rating, team_2_score_calc, team_2_player_2[1], score_difference)
-            self.__update_rating(team_2[1], int(team_2_player_2[0] + team_2_player_2_update))
+            ratings[team_2[1]] = self.__update_rating(cursor, match_id, team_2[1], team_2_player_2[0], int(team_2_player_2[0] + team_2_player_2_update)) + team_2_player_2[1:]
+        return ratings
 
+    @staticmethod
+    def __update_rating(cursor: sqlite3.Cursor, match_id: int, player_id: int, rating_before: int, rating: int) -> tuple[int, int]:
+        cursor.execute("UPDATE players set rating = ? where player_id = ?", (rating, player_id))
+        cursor.execute("INSERT INTO rating_history (player_id, match_id, rating_before, rating_after, delta) VALUES (?, ?, ?, ?, ?)",
+                       (player_id, match_id, rating_before, rating, rating - rating_before))
+        return rating_before, rating
+
+    @staticmethod
+    def __get_player_stats(cursor: sqlite3.Cursor, player_id:int) -> tuple[int, int, int]:
+        # player_stats already includes the match being recorded
+        cursor.execute('''
+            SELECT p.rating, COALESCE(s.games, 0), COALESCE(s.wins, 0) FROM players p
+            LEFT JOIN player_stats s ON s.player_id = p.player_id
+            WHERE p.player_id = ?
+        ''', (player_id,))
+        return cursor.fetchone()
 
 
-    def __update_rating(self, player_id: int, rating: int):
-        cursor = self.conn.cursor()
-        cursor.execute("UPDATE players set rating = ? where player_id = ?", (rating, player_id))
-        self.conn.commit()
 
-    def __get_player_stats(self, player_id:int) -> tuple[int, int]:
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT rating from players where player_id = ?", (player_id,))
-        rating = cursor.fetchone()[0]
-        cursor.execute("SELECT match_id FROM matches where team_1_player_1_id = ? or team_1_player_2_id = ? or team_2_player_1_id = ? or team_2_player_2_id = ?",
-                       (player_id, player_id, player_id, player_id))
-        games_played = len(cursor.fetchall())
-        return rating, games_played
 
 
 
 
+    def replay_ratings(self) -> dict:
+        """
+        Recomputes all ratings from DEFAULT_RANK over the full match history, used after the rating formula changes
+        """
+        summary = Replay.replay_all(self.conn, DEFAULT_RANK)
+        _bump_data_version(self.database)
+        _invalidate_leaderboard(self.database)
+        return summary
 
+    def import_matches(self, path: str, create_missing: bool = False) -> dict:
+        """
+        Bulk loads matches from a CSV/JSONL file then brings participants, stats and ratings up to date in one pass.
+        Ratings only replay the imported matches when they all come after the existing history, otherwise the full
+        history is replayed so older matches land in the right order.
+        """
+        with self.cursor() as cursor:
+            cursor.execute("SELECT COALESCE(MAX(match_id), 0), MAX(game_ts) FROM matches")
+            last_match_id, last_game_ts = cursor.fetchone()
 
+        try:
+            # import_file commits as it goes, so a failure here or in the rebuild leaves matches to take back out
+            summary = Importer.import_file(self.conn, path, DEFAULT_RANK, create_missing)
+            if summary['imported']:
+                self.rebuild_match_participants(after_match_id=last_match_id)
+                with self.cursor() as cursor:
+                    cursor.execute("SELECT MIN(game_ts) FROM matches WHERE match_id > ?", (last_match_id,))
+                    first_imported_ts = cursor.fetchone()[0]
+                if last_game_ts is None or first_imported_ts >= last_game_ts:
+                    summary['ratings'] = Replay.replay_tail(self.conn, DEFAULT_RANK, "WHERE match_id > ?", (last_match_id,))
+                else:
+                    summary['ratings'] = Replay.replay_all(self.conn, DEFAULT_RANK)
+                self.rebuild_player_stats()
+                self.rebuild_pair_stats()
+        except Exception:
+            logger.exception(f"Importing {path} failed, removing the imported matches")
+            self.__undo_import(last_match_id)
+            _bump_data_version(self.database)
+            _invalidate_leaderboard(self.database)
+            _invalidate_directory(self.database)
+            raise
+        if summary['imported'] or summary['created_players']:
+            _bump_data_version(self.database)
+            _invalidate_leaderboard(self.database)
+        if summary['created_players']:
+            _invalidate_directory(self.database)
+        logger.info(f"Imported matches from {path}: {summary}")
+        return summary
+
+    def __undo_import(self, last_match_id: int):
+        """
+        Deletes the matches added after last_match_id and everything derived from them, then recomputes
+        ratings and aggregates over the remaining history. Players created by the import are kept.
+        """
+        self.conn.rollback()
+        with self.conn:
+            with self.cursor() as cursor:
+                cursor.execute("DELETE FROM rating_history WHERE match_id > ?", (last_match_id,))
+                cursor.execute("DELETE FROM match_participants WHERE match_id > ?", (last_match_id,))
+                cursor.execute("DELETE FROM matches WHERE match_id > ?", (last_match_id,))
+        Replay.replay_all(self.conn, DEFAULT_RANK)
+        self.rebuild_player_stats()
+        self.rebuild_pair_stats()
+
+    def get_rating_history(self, player_id: int, max_points: int = Downsample.DEFAULT_MAX_POINTS) -> list[dict]:
+        """
+        Rating after each of the player's games, starting with their rating before the first one.
+        Long histories are downsampled with LTTB to at most max_points points.
+        """
+        with self.cursor() as cursor:
+            cursor.execute('''
+                SELECT h.rating_before, h.rating_after, m.game_ts FROM rating_history h
+                JOIN matches m ON m.match_id = h.match_id
+                WHERE h.player_id = ?
+                ORDER BY m.game_ts, h.match_id
+            ''', (player_id,))
+            rows = cursor.fetchall()
+        if not rows:
+            return []
+
+        points = [(0, rows[0][0], rows[0][2])] + [(i + 1, row[1], row[2]) for i, row in enumerate(rows)]
+        keep = Downsample.lttb([p[0] for p in points], [p[1] for p in points], max_points)
+        return [{'game': points[i][0], 'rating': points[i][1], 'date': points[i][2]} for i in keep]
+
+    def get_matchup_matrix(self) -> MatchupMatrix:
+        """
+        Roster ratings for expected score lookups, reloaded only when the data version changes
+        """
+        version = self.data_version
+        cached = _matchup_cache.get(self.database)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        with self.cursor() as cursor:
+            cursor.execute("SELECT player_id, rating FROM players")
+            matrix = MatchupMatrix(cursor.fetchall())
+        _matchup_cache[self.database] = (version, matrix)
+        return matrix
+
+    def predict_match(self, team_1: list[int], team_2: list[int]) -> dict:
+        return self.get_matchup_matrix().predict(team_1, team_2)
+
+    def get_partner_counts(self, player_ids: list[int]) -> dict[tuple[int, int], int]:
+        """
+        Games played together as partners for each pair in player_ids, keyed by (lower id, higher id)
+        """
+        placeholders = ', '.join('?' for _ in player_ids)
+        with self.cursor() as cursor:
+            cursor.execute(f'''
+                SELECT a.player_id, b.player_id, COUNT(*) FROM match_participants a
+                JOIN match_participants b ON b.match_id = a.match_id AND b.team = a.team AND b.player_id > a.player_id
+                WHERE a.player_id IN ({placeholders}) AND b.player_id IN ({placeholders})
+                GROUP BY a.player_id, b.player_id
+            ''', (*player_ids, *player_ids))
+            counts = {(a, b): games for a, b, games in cursor.fetchall()}
+        return counts
+
+    def matchmake(self, player_ids: list[int], avoid_repeat_partners: bool = True) -> dict:
+        """
+        Proposes doubles courts for the players present, see Matchmaker.make_courts
+        """
+        player_ids = [int(p) for p in player_ids]
+        placeholders = ', '.join('?' for _ in player_ids)
+        with self.cursor() as cursor:
+            cursor.execute(f"SELECT player_id, rating FROM players WHERE player_id IN ({placeholders})", player_ids)
+            ratings = dict(cursor.fetchall())
+
+        partner_counts = self.get_partner_counts(player_ids) if avoid_repeat_partners else None
+        matchmaker = Matchmaker(ratings, partner_counts, DEFAULT_REPEAT_PENALTY if avoid_repeat_partners else 0)
+        return matchmaker.make_courts(player_ids)
+
+    def get_pair_record(self, player_id: int, other_id: int, relation: str = OPPONENT) -> dict:
+        """
+        Record of player_id with (PARTNER) or against (OPPONENT) other_id, all zeros if they've never played
+        """
+        with self.cursor() as cursor:
+            cursor.execute('''
+                SELECT games, wins, points_for, points_against FROM pair_stats
+                WHERE player_a = ? AND relation = ? AND player_b = ?
+            ''', (player_id, relation, other_id))
+            row = cursor.fetchone()
+        return _pair_row(other_id, row or (0, 0, 0, 0))
+
+    def get_pair_records(self, player_id: int, relation: str = PARTNER) -> list[dict]:
+        """
+        player_id's record with every partner (or opponent) they've played, most games first
+        """
+        with self.cursor() as cursor:
+            cursor.execute('''
+                SELECT player_b, games, wins, points_for, points_against FROM pair_stats
+                WHERE player_a = ? AND relation = ?
+            ''', (player_id, relation))
+            rows = cursor.fetchall()
+        records = [_pair_row(row[0], row[1:]) for row in rows]
+        return sorted(records, key=lambda r: (-r['games'], -r['percent']))
+
+    def get_player_index(self) -> PlayerIndex:
+        """
+        Name prefix index for autocomplete, names are re-indexed when players change and
+        suggestions re-ordered when the data version changes
+        """
+        version = self.data_version
+        directory = self.get_player_directory()
+        cached = _player_index_cache.get(self.database)
+        if cached and cached[0] is directory and cached[1] == version:
+            return cached[2]
+
+        index = cached[2] if cached and cached[0] is directory else PlayerIndex(list(directory.values()))
+        with self.cursor() as cursor:
+            cursor.execute("SELECT player_id, last_played, games FROM player_stats")
+            index.set_activity({row[0]: (row[1], row[2]) for row in cursor.fetchall()})
+        _player_index_cache[self.database] = (directory, version, index)
+        return index
+
+    def search_players(self, query: str, limit: int = 25) -> list[dict]:
+        """
+        Directory entries whose first, last or full name starts with query, most recently active first
+        """
+        return self.get_player_index().search(query, limit)
 
     def retrieve_player_list(self) -> list:
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT player_id, first_name, last_name from players")
-        player_rows = cursor.fetchall()
-        players = [
-            {'player_id': p[0], 'first_name':p[1], 'last_name':p[2]} for p in player_rows
-        ]
-        return players
+        return list(self.get_player_directory().values())
+
+
+
+
 
+def _leaderboard_row(row: tuple) -> dict:
+    player_id, first_name, last_name, rating, games, wins, losses, rank = row
+    return {'player_id': player_id,
+            'wins': wins,
+            'losses': losses,
+            'games': games,
+            'percent': wins / games * 100 if games > 0 else 0,
+            'rating': rating,
+            'name': display_name(first_name, last_name),
+            'rank': rank if rank is not None else 'NR'
+            }
 
 
+def _pair_row(other_id: int, row: tuple) -> dict:
+    games, wins, points_for, points_against = row
+    return {'player_id': other_id,
+            'games': games,
+            'wins': wins,
+            'losses': games - wins,
+            'percent': wins / games * 100 if games > 0 else 0,
+            'points_for': points_for,
+            'points_against': points_against
+            }
 
 
 def update_wins_losses(player_score, opp_score, wins, losses) -> tuple[int, int]:
@@ -1,7 +1,9 @@
 from enum import Enum
-from typing import Literal
+from typing import Literal, Optional
 import math
 
+import numpy as np
+
 LOWER_PLAYER_RATIO = .7 # currently assuming lower rated player has greater ratio/impact on team rating
 
 class Score(Enum):
@@ -135,6 +137,30 @@ def calculate_team_rating(player_1_rating: float, player_2_rating: float) -> flo
 
 
 
+def calculate_expected_score_matrix(ratings_a: np.ndarray, ratings_b: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Vectorized calculate_expected_score for every pairing in one pass
+    :param ratings_a: ratings for the rows
+    :param ratings_b: ratings for the columns, defaults to ratings_a
+    :return: matrix where [i, j] is the expected score of ratings_a[i] against ratings_b[j]
+    """
+    ratings_a = np.asarray(ratings_a, dtype=np.float64)
+    ratings_b = ratings_a if ratings_b is None else np.asarray(ratings_b, dtype=np.float64)
+    return 1 / (1 + 10 ** ((ratings_b[np.newaxis, :] - ratings_a[:, np.newaxis]) / 400))
+
+def calculate_team_ratings(player_1_ratings: np.ndarray, player_2_ratings: np.ndarray) -> np.ndarray:
+    """
+    Vectorized calculate_team_rating, NaN in player_2_ratings marks a singles team
+    """
+    player_1_ratings = np.asarray(player_1_ratings, dtype=np.float64)
+    player_2_ratings = np.asarray(player_2_ratings, dtype=np.float64)
+    lower = np.fmin(player_1_ratings, player_2_ratings)
+    higher = np.fmax(player_1_ratings, player_2_ratings)
+    doubles = (lower * LOWER_PLAYER_RATIO) + (higher * (1.0 - LOWER_PLAYER_RATIO))
+    return np.where(np.isnan(player_2_ratings), player_1_ratings, doubles)
+
+
+
 
 if __name__ == '__main__':
 
@@ -0,0 +1,244 @@
+import logging
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from app_server.backend import connections as Connections
+from app_server.backend import rating as Rating
+
+logger = logging.getLogger('bot_logger')
+
+FETCH_SIZE = 50000
+# a full snapshot of every rated player's rating is kept at least this many matches apart, and never closer
+# together than the number of rated players so snapshots never outgrow the match history itself
+CHECKPOINT_INTERVAL = 500
+NO_PLAYER = 0  # player ids start at 1, so 0 marks an empty partner slot
+
+
+@dataclass
+class MatchArrays:
+    """
+    Columnar copy of the matches table in replay order, missing partners are NO_PLAYER
+    """
+    match_id: np.ndarray
+    team_1_player_1: np.ndarray
+    team_1_player_2: np.ndarray
+    team_2_player_1: np.ndarray
+    team_2_player_2: np.ndarray
+    team_1_score: np.ndarray
+    team_2_score: np.ndarray
+
+    def __len__(self):
+        return len(self.match_id)
+
+
+def load_matches(conn: sqlite3.Connection, where: str = '', params: tuple = ()) -> MatchArrays:
+    """
+    Streams matches in (game_ts, match_id) order into NumPy arrays
+    :param where: optional SQL filter, e.g. 'WHERE match_id > ?'
+    """
+    with Connections.cursor(conn) as cursor:
+        cursor.execute(f'''
+            SELECT match_id, team_1_player_1_id, COALESCE(team_1_player_2_id, {NO_PLAYER}),
+                   team_2_player_1_id, COALESCE(team_2_player_2_id, {NO_PLAYER}), team_1_score, team_2_score
+            FROM matches {where}
+            ORDER BY game_ts, match_id
+        ''', params)
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.int64))
+
+    columns = np.concatenate(chunks) if chunks else np.empty((0, 7), dtype=np.int64)
+    return MatchArrays(*(columns[:, i] for i in range(7)))
+
+
+def replay(matches: MatchArrays, ratings: np.ndarray, games: np.ndarray,
+           history: Optional[list] = None, checkpoints: Optional[list] = None,
+           checkpoint_every: int = CHECKPOINT_INTERVAL) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Applies every match in order to the starting ratings and game counts, both indexed by player_id.
+    Matches depend on the ratings left by the ones before them so they are applied one at a time, using the
+    same rating functions and integer truncation as Player.add_match so results are identical.
+    :param history: if given, (player_id, match_id, rating_before, rating_after, delta) rows are appended to it
+    :param checkpoints: if given, (match_id, [(player_id, rating, games)]) snapshots of every rated player are
+                        appended to it after each checkpoint_every matches
+    :return: new ratings and games arrays
+    """
+    # plain lists index much faster than NumPy scalars in a sequential loop
+    r = ratings.tolist()
+    g = games.tolist()
+    update = Rating.calculate_player_ranking_update
+    team_rating = Rating.calculate_team_rating
+    since_checkpoint = 0
+
+    for match_id, t1p1, t1p2, t2p1, t2p2, t1_score, t2_score in zip(matches.match_id.tolist(),
+                                                         matches.team_1_player_1.tolist(),
+                                                         matches.team_1_player_2.tolist(),
+                                                         matches.team_2_player_1.tolist(),
+                                                         matches.team_2_player_2.tolist(),
+                                                         matches.team_1_score.tolist(),
+                                                         matches.team_2_score.tolist()):
+        team_1 = (t1p1, t1p2) if t1p2 != NO_PLAYER else (t1p1,)
+        team_2 = (t2p1, t2p2) if t2p2 != NO_PLAYER else (t2p1,)
+        for p in team_1 + team_2:
+            g[p] += 1
+
+        team_1_rating = team_rating(r[t1p1], r[t1p2] if t1p2 != NO_PLAYER else None)
+        team_2_rating = team_rating(r[t2p1], r[t2p2] if t2p2 != NO_PLAYER else None)
+        team_1_score_calc = 1.0 if t1_score > t2_score else 0.0
+        score_difference = abs(t1_score - t2_score)
+
+        for p in team_1:
+            before = r[p]
+            r[p] = int(before + update(team_1_rating, team_2_rating, team_1_score_calc, g[p], score_difference))
+            if history is not None:
+                history.append((p, match_id, before, r[p], r[p] - before))
+        for p in team_2:
+            before = r[p]
+            r[p] = int(before + update(team_2_rating, team_1_rating, 1.0 - team_1_score_calc, g[p], score_difference))
+            if history is not None:
+                history.append((p, match_id, before, r[p], r[p] - before))
+
+        since_checkpoint += 1
+        if checkpoints is not None and since_checkpoint >= checkpoint_every:
+            checkpoints.append((match_id, [(p, r[p], g[p]) for p in range(len(g)) if g[p]]))
+            since_checkpoint = 0
+
+    return np.array(r, dtype=np.int64), np.array(g, dtype=np.int64)
+
+
+def _max_player_id(current: dict, matches: MatchArrays) -> int:
+    return max(max(current, default=0), int(matches.team_1_player_1.max(initial=0)),
+               int(matches.team_2_player_1.max(initial=0)), int(matches.team_1_player_2.max(initial=0)),
+               int(matches.team_2_player_2.max(initial=0)))
+
+
+def _replay_and_write(conn: sqlite3.Connection, matches: MatchArrays, ratings: np.ndarray, games: np.ndarray,
+                      current: dict, start: float, clear_history: bool, write_ratings: bool = True) -> dict:
+    history = []
+    checkpoints = []
+    ratings, _ = replay(matches, ratings, games, history, checkpoints, checkpoint_interval(len(current)))
+
+    player_ids = np.fromiter(current.keys(), dtype=np.int64, count=len(current))
+    new_ratings = ratings[player_ids]
+    old_ratings = np.fromiter(current.values(), dtype=np.int64, count=len(current))
+    changed = new_ratings != old_ratings
+    with conn:
+        if write_ratings:
+            conn.executemany("UPDATE players SET rating = ? WHERE player_id = ?",
+                             zip(new_ratings[changed].tolist(), player_ids[changed].tolist()))
+        if clear_history:
+            conn.execute("DELETE FROM rating_history")
+            conn.execute("DELETE FROM checkpoint_ratings")
+            conn.execute("DELETE FROM rating_checkpoints")
+        conn.executemany("INSERT OR REPLACE INTO rating_history (player_id, match_id, rating_before, rating_after, delta) "
+                         "VALUES (?, ?, ?, ?, ?)", history)
+        write_checkpoints(conn, checkpoints)
+
+    summary = {'matches': len(matches),
+               'players': len(player_ids),
+               'changed': int(np.count_nonzero(changed)),
+               'seconds': time.perf_counter() - start
+               }
+    logger.info(f"Replayed ratings: {summary}")
+    return summary
+
+
+def checkpoint_interval(player_count: int) -> int:
+    return max(CHECKPOINT_INTERVAL, player_count)
+
+
+def write_checkpoints(conn: sqlite3.Connection, checkpoints: list[tuple[int, list[tuple[int, int, int]]]]):
+    """
+    Saves snapshots from replay(), each one is the state of the ratings right after its match
+    """
+    with Connections.cursor(conn) as cursor:
+        for match_id, snapshot in checkpoints:
+            cursor.execute("INSERT INTO rating_checkpoints (match_id, game_ts) SELECT match_id, game_ts FROM matches "
+                           "WHERE match_id = ?", (match_id,))
+            checkpoint_id = cursor.lastrowid
+            cursor.executemany("INSERT INTO checkpoint_ratings (checkpoint_id, player_id, rating, games) VALUES (?, ?, ?, ?)",
+                               [(checkpoint_id, *row) for row in snapshot])
+
+
+def replay_all(conn: sqlite3.Connection, default_rating: int, write_ratings: bool = True) -> dict:
+    """
+    Recomputes every player's rating from default_rating by replaying the full match history,
+    then writes all ratings and the rating history back in a single transaction
+    :param write_ratings: False to only regenerate rating_history
+    """
+    start = time.perf_counter()
+    with Connections.cursor(conn) as cursor:
+        cursor.execute("SELECT player_id, rating FROM players")
+        current = dict(cursor.fetchall())
+
+    matches = load_matches(conn)
+    max_id = _max_player_id(current, matches)
+    ratings = np.full(max_id + 1, default_rating, dtype=np.int64)
+    games = np.zeros(max_id + 1, dtype=np.int64)
+
+    return _replay_and_write(conn, matches, ratings, games, current, start, clear_history=True,
+                             write_ratings=write_ratings)
+
+
+def replay_tail(conn: sqlite3.Connection, default_rating: int, where: str, params: tuple = ()) -> dict:
+    """
+    Applies only the matches selected by where on top of the current ratings and player_stats game counts.
+    Only valid when those matches come after everything already rated and are not yet counted in player_stats.
+    """
+    start = time.perf_counter()
+    with Connections.cursor(conn) as cursor:
+        cursor.execute("SELECT player_id, rating FROM players")
+        current = dict(cursor.fetchall())
+        cursor.execute("SELECT player_id, games FROM player_stats")
+        played = cursor.fetchall()
+
+    matches = load_matches(conn, where, params)
+    max_id = _max_player_id(current, matches)
+    ratings = np.full(max_id + 1, default_rating, dtype=np.int64)
+    games = np.zeros(max_id + 1, dtype=np.int64)
+    for player_id, rating in current.items():
+        ratings[player_id] = rating
+    for player_id, count in played:
+        games[player_id] = count
+
+    return _replay_and_write(conn, matches, ratings, games, current, start, clear_history=False)
+
+
+def replay_from_checkpoint(conn: sqlite3.Connection, default_rating: int,
+                           checkpoint: Optional[tuple[int, str, int]]) -> dict:
+    """
+    Recomputes ratings for only the matches after a checkpoint, starting from its snapshot rather than
+    replaying the full history. Checkpoints after it are replaced by ones taken during the replay.
+    Commits any open transaction along with the new ratings.
+    :param checkpoint: (checkpoint_id, game_ts, match_id), None to replay from the first match
+    """
+    start = time.perf_counter()
+    with Connections.cursor(conn) as cursor:
+        cursor.execute("SELECT player_id, rating FROM players")
+        current = dict(cursor.fetchall())
+        if checkpoint:
+            cursor.execute("SELECT player_id, rating, games FROM checkpoint_ratings WHERE checkpoint_id = ?",
+                           (checkpoint[0],))
+            snapshot = cursor.fetchall()
+            where, params = "WHERE (game_ts, match_id) > (?, ?)", checkpoint[1:]
+        else:
+            snapshot, where, params = [], '', ()
+        cursor.execute("DELETE FROM checkpoint_ratings WHERE checkpoint_id > ?", (checkpoint[0] if checkpoint else 0,))
+        cursor.execute("DELETE FROM rating_checkpoints WHERE checkpoint_id > ?", (checkpoint[0] if checkpoint else 0,))
+
+    matches = load_matches(conn, where, params)
+    max_id = _max_player_id(current, matches)
+    ratings = np.full(max_id + 1, default_rating, dtype=np.int64)
+    games = np.zeros(max_id + 1, dtype=np.int64)
+    for player_id, rating, count in snapshot:
+        ratings[player_id] = rating
+        games[player_id] = count
+
+    return _replay_and_write(conn, matches, ratings, games, current, start, clear_history=False)
@@ -0,0 +1,221 @@
+import asyncio
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from app_server.backend.players import Player, DATABASE, OPPONENT, PARTNER, get_data_version
+
+DEFAULT_WORKERS = 4
+DEFAULT_CONNECTIONS_PER_WORKER = 8
+# most matches the writer will commit in one transaction
+MAX_WRITE_BATCH = 200
+
+
+class StorePool:
+    """
+    Bounded thread pool shared by every league. Each worker thread keeps its own LRU of Player instances
+    (one SQLite connection each) keyed by database, closing the least recently used one past the limit.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS,
+                 max_connections_per_worker: int = DEFAULT_CONNECTIONS_PER_WORKER):
+        self.max_connections_per_worker = max_connections_per_worker
+        self._local = threading.local()
+        # every open Player across all workers, so close() can release their connections
+        self._open: set[Player] = set()
+        self._open_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='player-store')
+
+    def player(self, database: str) -> Player:
+        """
+        Must be called from a worker thread, returns that thread's Player for the database
+        """
+        players = getattr(self._local, 'players', None)
+        if players is None:
+            players = self._local.players = OrderedDict()
+
+        player = players.get(database)
+        if player is not None:
+            players.move_to_end(database)
+            return player
+
+        player = players[database] = Player(database)
+        with self._open_lock:
+            self._open.add(player)
+        while len(players) > self.max_connections_per_worker:
+            _, evicted = players.popitem(last=False)
+            with self._open_lock:
+                self._open.discard(evicted)
+            evicted.close()
+        return player
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def close(self):
+        """
+        Waits for queued calls to finish then closes every connection, the pool can't be used afterwards
+        """
+        self._executor.shutdown(wait=True)
+        with self._open_lock:
+            for player in self._open:
+                player.close()
+            self._open.clear()
+
+
+_default_pool = None
+
+
+def default_pool() -> StorePool:
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = StorePool()
+    return _default_pool
+
+
+class AsyncPlayerStore:
+    """
+    Async facade over Player so SQLite work never runs on the Discord event loop.
+    Calls are run on a bounded StorePool, each worker thread using its own Player (and connection).
+    Writes go through a single writer task so they apply one at a time in arrival order, and matches that
+    queue up behind each other are committed together in one transaction.
+    """
+
+    def __init__(self, database: str = DATABASE, pool: Optional[StorePool] = None):
+        self.database = database
+        self._pool = pool or default_pool()
+        self._writes: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    def _call(self, method_name: str, *args, **kwargs):
+        return getattr(self._pool.player(self.database), method_name)(*args, **kwargs)
+
+    async def _run(self, method_name: str, *args, **kwargs):
+        return await self._pool.run(self._call, method_name, *args, **kwargs)
+
+    async def _write(self, method_name: str, *args):
+        """
+        Queues a write for the writer task and waits for its result
+        """
+        loop = asyncio.get_running_loop()
+        if self._writer is None or self._writer.done():
+            self._writes = asyncio.Queue()
+            self._writer = loop.create_task(self._write_loop())
+        future = loop.create_future()
+        await self._writes.put((method_name, args, future))
+        return await future
+
+    async def _write_loop(self):
+        carried = None
+        while True:
+            item = carried or await self._writes.get()
+            carried = None
+            if item[0] != 'add_match':
+                await self._apply([item], item[0], *item[1])
+                continue
+
+            # take every match already waiting, up to the first write that isn't a match
+            batch = [item]
+            while len(batch) < MAX_WRITE_BATCH and not self._writes.empty():
+                queued = self._writes.get_nowait()
+                if queued[0] != 'add_match':
+                    carried = queued
+                    break
+                batch.append(queued)
+
+            if not await self._apply(batch, 'add_matches', [queued[1] for queued in batch]) and len(batch) > 1:
+                # one bad match rolled back the batch, retry them one by one so only that caller sees the error
+                for queued in batch:
+                    await self._apply([queued], 'add_matches', [queued[1]])
+
+    async def _apply(self, items: list[tuple], method_name: str, *args) -> bool:
+        """
+        Runs one write and resolves the futures of the queued items with its result
+        :return: False if the write raised, the error is only passed on when it was for a single item
+        """
+        try:
+            result = await self._run(method_name, *args)
+        except Exception as e:
+            if len(items) == 1 and not items[0][2].done():
+                items[0][2].set_exception(e)
+            return False
+
+        results = result if method_name == 'add_matches' else [result]
+        for (_, _, future), item_result in zip(items, results):
+            if not future.done():
+                future.set_result(item_result)
+        return True
+
+    @property
+    def data_version(self) -> int:
+        return get_data_version(self.database)
+
+    async def get_all_current_ranking(self, limit: Optional[int] = None, offset: int = 0) -> list[dict]:
+        return await self._run('get_all_current_ranking', limit, offset)
+
+    async def get_player_rank(self, player_id: int) -> Optional[dict]:
+        return await self._run('get_player_rank', player_id)
+
+    async def get_rank_neighbourhood(self, player_id: int, radius: int = 2) -> list[dict]:
+        return await self._run('get_rank_neighbourhood', player_id, radius)
+
+    async def get_top_players(self, count: int) -> list[dict]:
+        return await self._run('get_top_players', count)
+
+    async def get_player_matches(self, match_count: int, player_id: int, opp_id: Optional[int] = None) -> list[dict]:
+        return await self._run('get_player_matches', match_count, player_id, opp_id)
+
+    async def get_rating_history(self, player_id: int) -> list[dict]:
+        return await self._run('get_rating_history', player_id)
+
+    async def get_player_matches_page(self, match_count: int, player_id: int, opp_id: Optional[int] = None,
+                                      before: Optional[tuple[str, int]] = None) -> tuple[list[dict], Optional[tuple[str, int]]]:
+        return await self._run('get_player_matches_page', match_count, player_id, opp_id, before)
+
+    async def search_players(self, query: str, limit: int = 25) -> list[dict]:
+        return await self._run('search_players', query, limit)
+
+    async def retrieve_player_list(self) -> list:
+        return await self._run('retrieve_player_list')
+
+    async def create_new_player(self, first_name: str, last_name: str, discord_id: int = None) -> bool:
+        return await self._write('create_new_player', first_name, last_name, discord_id)
+
+    async def update_discord_id(self, player_id: int, discord_id: int) -> bool:
+        return await self._write('update_discord_id', player_id, discord_id)
+
+    async def add_match(self, team_1: list[int], team_2: list[int], team_1_score: int, team_2_score: int) -> dict:
+        """
+        :return: {'match_id', 'ratings': {player_id: {'rating_before', 'rating_after', 'delta'}}}
+        """
+        Player.check_teams(team_1, team_2)  # fail fast rather than rolling back a whole batch
+        return await self._write('add_match', team_1, team_2, team_1_score, team_2_score)
+
+    async def edit_match(self, match_id: int, team_1: list[int], team_2: list[int], team_1_score: int,
+                         team_2_score: int) -> Optional[dict]:
+        Player.check_teams(team_1, team_2)
+        return await self._write('edit_match', match_id, team_1, team_2, team_1_score, team_2_score)
+
+    async def delete_match(self, match_id: int) -> Optional[dict]:
+        return await self._write('delete_match', match_id)
+
+    async def predict_match(self, team_1: list[int], team_2: list[int]) -> dict:
+        return await self._run('predict_match', team_1, team_2)
+
+    async def matchmake(self, player_ids: list[int], avoid_repeat_partners: bool = True) -> dict:
+        return await self._run('matchmake', player_ids, avoid_repeat_partners)
+
+    async def import_matches(self, path: str, create_missing: bool = False) -> dict:
+        return await self._write('import_matches', path, create_missing)
+
+    async def get_pair_record(self, player_id: int, other_id: int, relation: str = OPPONENT) -> dict:
+        return await self._run('get_pair_record', player_id, other_id, relation)
+
+    async def get_pair_records(self, player_id: int, relation: str = PARTNER) -> list[dict]:
+        return await self._run('get_pair_records', player_id, relation)
+
+    async def replay_ratings(self) -> dict:
+        return await self._write('replay_ratings')
@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from app_server import renderer
+from app_server.backend.players import Player
+
+DEFAULT_SIZES = '50x10000'
+DEFAULT_RUNS = 5
+ADD_MATCH_COUNT = 200
+INSERT_BATCH = 10000
+
+# statements each operation may run regardless of league size, anything that scales with players or matches
+# (an N+1 pattern) blows through these on all but the smallest leagues
+QUERY_BUDGETS = {
+    'get_all_current_ranking': 1,
+    'get_player_rank': 0,
+    'get_player_matches': 2,
+    'get_pair_record': 1,
+    'add_match': 30,
+}
+
+
+def parse_sizes(sizes: str) -> list[tuple[int, int]]:
+    """
+    '50x10000,1000x100000' -> [(50, 10000), (1000, 100000)]
+    """
+    return [tuple(int(n) for n in size.lower().split('x')) for size in sizes.split(',')]
+
+
+def generate_league(database: str, player_count: int, match_count: int, seed: int = 0) -> Player:
+    """
+    Fills a fresh database with random players and a mix of singles and doubles matches,
+    then builds the aggregates and ratings the same way a bulk import does
+    """
+    rng = random.Random(seed)
+    player = Player(database)
+    with player.conn:
+        player.conn.executemany("INSERT INTO players (first_name, last_name, rating) VALUES (?, ?, 1500)",
+                                ((f"Player{i}", f"Last{i}") for i in range(player_count)))
+
+    def matches():
+        for i in range(match_count):
+            day, second = divmod(i, 86400 // 60)
+            ts = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(1577836800 + day * 86400 + second * 60))
+            winner, loser = 11, rng.randint(0, 9)
+            scores = (winner, loser) if rng.random() < 0.5 else (loser, winner)
+            if player_count >= 4 and rng.random() < 0.8:
+                a, b, c, d = rng.sample(range(1, player_count + 1), 4)
+            else:
+                a, c = rng.sample(range(1, player_count + 1), 2)
+                b = d = None
+            yield a, b, c, d, scores[0], scores[1], ts
+
+    rows = matches()
+    while True:
+        with player.conn:
+            batch = [row for _, row in zip(range(INSERT_BATCH), rows)]
+            player.conn.executemany('''
+                INSERT INTO matches (team_1_player_1_id, team_1_player_2_id, team_2_player_1_id, team_2_player_2_id,
+                                     team_1_score, team_2_score, game_ts)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', batch)
+        if len(batch) < INSERT_BATCH:
+            break
+
+    player.rebuild_match_participants()
+    player.rebuild_player_stats()
+    player.rebuild_pair_stats()
+    player.replay_ratings()
+    return player
+
+
+@contextmanager
+def count_queries(player: Player):
+    statements = []
+    player.conn.set_trace_callback(statements.append)
+    try:
+        yield statements
+    finally:
+        player.conn.set_trace_callback(None)
+
+
+def time_runs(func, runs: int) -> dict:
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return {'median_ms': statistics.median(durations),
+            'min_ms': min(durations),
+            'max_ms': max(durations),
+            'runs': runs
+            }
+
+
+def bench_league(player_count: int, match_count: int, runs: int, render: bool) -> dict:
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        player = generate_league(os.path.join(tmp_dir, 'bench.db'), player_count, match_count)
+        setup_seconds = time.perf_counter() - start
+
+        def random_player():
+            return rng.randint(1, player_count)
+
+        def random_teams():
+            ids = rng.sample(range(1, player_count + 1), 4)
+            return ids[:2], ids[2:]
+
+        operations = {
+            'get_all_current_ranking': lambda: player.get_all_current_ranking(),
+            'get_all_current_ranking_page': lambda: player.get_all_current_ranking(limit=25),
+            'get_player_rank': lambda: player.get_player_rank(random_player()),
+            'get_player_matches': lambda: player.get_player_matches(10, random_player()),
+            'get_pair_record': lambda: player.get_pair_record(*random_teams()[0]),
+            'search_players': lambda: player.search_players(rng.choice('abcdefghijklmnopqrstuvwxyz')),
+        }
+        timings = {name: time_runs(func, runs) for name, func in operations.items()}
+
+        queries = {}
+        for name in ('get_all_current_ranking', 'get_player_rank', 'get_player_matches', 'get_pair_record'):
+            with count_queries(player) as statements:
+                operations[name]()
+            queries[name] = len(statements)
+
+        with count_queries(player) as statements:
+            player.add_match(*random_teams(), 11, 5)
+        queries['add_match'] = len(statements)
+
+        start = time.perf_counter()
+        for _ in range(ADD_MATCH_COUNT):
+            team_1, team_2 = random_teams()
+            player.add_match(team_1, team_2, 11, rng.randint(0, 9))
+        elapsed = time.perf_counter() - start
+        timings['add_match'] = {'matches_per_second': ADD_MATCH_COUNT / elapsed,
+                                'median_ms': elapsed * 1000 / ADD_MATCH_COUNT,
+                                'runs': ADD_MATCH_COUNT
+                                }
+
+        # correcting a recent match only replays from the checkpoint before it
+        with player.cursor() as cursor:
+            cursor.execute("SELECT MAX(match_id) FROM matches")
+            edit_id = max(1, cursor.fetchone()[0] - 2 * ADD_MATCH_COUNT)
+        start = time.perf_counter()
+        summary = player.edit_match(edit_id, *random_teams(), 11, 7)
+        timings['edit_match'] = {'ms': (time.perf_counter() - start) * 1000, 'replayed': summary['matches']}
+
+        if render:
+            rankings = player.get_all_current_ranking()
+            history = player.get_player_matches(10, 1)
+            timings['render_rankings'] = time_runs(lambda: renderer.render_rankings(rankings), runs)
+            timings['render_match_history'] = time_runs(lambda: renderer.render_match_history(history, 'Player0 L.'),
+                                                        runs)
+        player.conn.close()
+
+    return {'players': player_count,
+            'matches': match_count,
+            'setup_seconds': setup_seconds,
+            'timings': timings,
+            'queries': queries,
+            'query_budget_violations': {name: count for name, count in queries.items()
+                                        if count > QUERY_BUDGETS.get(name, count)}
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Player store and renderers on synthetic leagues')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help='comma separated PLAYERSxMATCHES league sizes, e.g. 50x10000,1000x100000,10000x1000000')
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help='timed runs per operation')
+    parser.add_argument('--no-render', action='store_true', help='skip the image render benchmarks')
+    parser.add_argument('--assert-queries', action='store_true',
+                        help='exit non-zero if any operation runs more statements than its QUERY_BUDGETS entry')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    args = parser.parse_args()
+
+    if not args.no_render:
+        renderer._init_worker()  # render in-process so only the rendering itself is timed
+
+    report = {'python': platform.python_version(),
+              'sqlite': sqlite3.sqlite_version,
+              'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+              'results': [bench_league(players, matches, args.runs, not args.no_render)
+                          for players, matches in parse_sizes(args.sizes)]
+              }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    violations = [(r['players'], r['matches'], r['query_budget_violations'])
+                  for r in report['results'] if r['query_budget_violations']]
+    if args.assert_queries and violations:
+        print(f"Query budget exceeded: {violations}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
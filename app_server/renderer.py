@@ -0,0 +1,239 @@
+import asyncio
+import io
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app_server.backend import metrics
+
+DEFAULT_WORKERS = 2
+
+BG_COLOR = "#FFFFFF"
+TEXT_COLOR = "#000000"
+
+_executor = None
+
+# populated in each worker process by _init_worker so the heavy imports only happen once per worker
+pd = None
+matplotlib = None
+plt = None
+ColumnDefinition = None
+Table = None
+normed_cmap = None
+
+
+def _init_worker():
+    global pd, matplotlib, plt, ColumnDefinition, Table, normed_cmap
+    import pandas as pd
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from plottable import ColumnDefinition, Table
+    from plottable.cmap import normed_cmap
+
+
+def _ready() -> bool:
+    return True
+
+
+def _figure_to_png(fig) -> bytes:
+    buffer = io.BytesIO()
+    fig.savefig(
+        buffer,
+        format='png',
+        dpi=200,
+        bbox_inches="tight"
+    )
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def render_rankings(player_list: list[dict]) -> tuple[bytes, dict]:
+    return _timed_render(_render_rankings, player_list)
+
+
+def render_match_history(matches: list[dict], player_name: str) -> tuple[bytes, dict]:
+    return _timed_render(_render_match_history, matches, player_name)
+
+
+def render_rating_chart(points: list[dict], player_name: str) -> tuple[bytes, dict]:
+    return _timed_render(_render_rating_chart, points, player_name)
+
+
+def _timed_render(func, *args) -> tuple[bytes, dict]:
+    """
+    Runs in the worker, returns the PNG with the time spent in each stage so the bot process can record it
+    """
+    timings = {}
+    start = time.perf_counter()
+    image = func(timings, *args)
+    timings['render'] = (time.perf_counter() - start) * 1000 - timings.get('dataframe', 0)
+    return image, timings
+
+
+def _render_rankings(timings: dict, player_list: list[dict]) -> bytes:
+    start = time.perf_counter()
+    df = pd.DataFrame(player_list)
+    new_order = ['rank', 'name', 'games', 'wins', 'losses', 'percent']
+    df_reorderd = df[new_order]
+
+    df['percent'] = df['percent'].map('{:,.2f}'.format).astype(str)
+    df_reorderd.update(df[['percent']].astype(float))
+    timings['dataframe'] = (time.perf_counter() - start) * 1000
+
+    col_defs = [
+        ColumnDefinition(name="rank",
+                         title="Rank",
+                         textprops={"ha": "left", "weight": "bold"},
+                         group="Player", ),
+        ColumnDefinition(name="name",
+                         title="Name",
+                         textprops={"ha": "left"},
+                         group="Player"),
+        ColumnDefinition(name="games",
+                         title="Games Played",
+                         textprops={"ha": "center"},
+                         group="Stats"),
+        ColumnDefinition(name="wins",
+                         title="Wins",
+                         textprops={"ha": "center"},
+                         group="Stats"),
+        ColumnDefinition(name="losses",
+                         title="Losses",
+                         textprops={"ha": "center"},
+                         group="Stats"),
+        ColumnDefinition(name="percent",
+                         title="Win %",
+                         textprops={"ha": "center", "color": TEXT_COLOR, "weight": "bold"},
+                         group="Stats",
+                         cmap=normed_cmap(df_reorderd['percent'], cmap=matplotlib.colormaps['RdYlGn'], num_stds=2))
+    ]
+
+    height = max(len(player_list) - 3, 4)
+
+    fig, ax = plt.subplots(figsize=(10, height))
+    ax.axis('off')  # Hide axes
+    fig.set_facecolor(BG_COLOR)
+    ax.set_facecolor(BG_COLOR)
+    Table(
+        df_reorderd,
+        column_definitions=col_defs,
+        index_col="rank",
+        row_dividers=True,
+        footer_divider=True,
+        textprops={'fontsize': 14},
+        ax=ax
+    )
+
+    return _figure_to_png(fig)
+
+
+def _render_match_history(timings: dict, matches: list[dict], player_name: str) -> bytes:
+    start = time.perf_counter()
+    df = pd.DataFrame(matches)
+    new_order = ['result', 'partner', 'opponent', 'score', 'opponent_score', 'date']
+    df_reordered = df[new_order]
+    timings['dataframe'] = (time.perf_counter() - start) * 1000
+
+    col_defs = [
+        ColumnDefinition(name="date",
+                         title="Date",
+                         textprops={"ha": "left"}),
+        ColumnDefinition(name="result",
+                         title="Result",
+                         textprops={"ha": "left", "weight": "bold"}),
+        ColumnDefinition(name="partner",
+                         title="Partner",
+                         textprops={"ha": "left"},
+                         group='Players'),
+        ColumnDefinition(name="opponent",
+                         title="Opponent",
+                         textprops={"ha": "left"},
+                         group='Players'),
+        ColumnDefinition(name="score",
+                         title="Score",
+                         textprops={"ha": "center"},
+                         group="Score"),
+        ColumnDefinition(name="opponent_score",
+                         title="Opponent Score",
+                         textprops={"ha": "center"},
+                         group="Score"),
+        ]
+    height = max(len(matches) - 3, 4)
+
+    fig, ax = plt.subplots(figsize=(20, height))
+    ax.axis('off')  # Hide axes
+    fig.set_facecolor(BG_COLOR)
+    ax.set_facecolor(BG_COLOR)
+
+    fig.suptitle(f"{player_name} Match History", fontsize=24, fontweight='bold', color='black')
+
+    Table(
+        df_reordered,
+        column_definitions=col_defs,
+        index_col="date",
+        row_dividers=True,
+        footer_divider=True,
+        textprops={'fontsize': 14},
+        ax=ax
+    )
+
+    return _figure_to_png(fig)
+
+
+def _render_rating_chart(timings: dict, points: list[dict], player_name: str) -> bytes:
+    fig, ax = plt.subplots(figsize=(12, 6))
+    fig.set_facecolor(BG_COLOR)
+    ax.set_facecolor(BG_COLOR)
+
+    ax.plot([p['game'] for p in points], [p['rating'] for p in points], color='#1f77b4', linewidth=2)
+    ax.set_xlabel('Games Played', fontsize=14)
+    ax.set_ylabel('Rating', fontsize=14)
+    ax.grid(True, alpha=0.3)
+    ax.spines[['top', 'right']].set_visible(False)
+
+    fig.suptitle(f"{player_name} Rating History", fontsize=24, fontweight='bold', color='black')
+
+    return _figure_to_png(fig)
+
+
+def start(max_workers: int = DEFAULT_WORKERS):
+    """
+    Creates the render pool on first use and starts every worker on its imports without waiting for them,
+    so the bot process itself never imports pandas/matplotlib/plottable.
+    Workers are spawned rather than forked since the bot already has threads running by then.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        for _ in range(max_workers):
+            _executor.submit(_ready)
+    return _executor
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+async def _render(command: str, func, *args) -> bytes:
+    loop = asyncio.get_running_loop()
+    image, timings = await loop.run_in_executor(start(), func, *args)
+    for stage_name, ms in timings.items():
+        metrics.observe(metrics.STAGE_HISTOGRAM, ms, command=command, stage=stage_name)
+    return image
+
+
+async def rankings_image(player_list: list[dict]) -> bytes:
+    return await _render('listrank', render_rankings, player_list)
+
+
+async def match_history_image(matches: list[dict], player_name: str) -> bytes:
+    return await _render('playerhistory', render_match_history, matches, player_name)
+
+
+async def rating_chart_image(points: list[dict], player_name: str) -> bytes:
+    return await _render('ratingchart', render_rating_chart, points, player_name)